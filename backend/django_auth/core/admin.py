@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Video, VideoFile, Comment, Like, WatchHistory, VideoAnalytics
+from .models import Video, VideoFile, VideoProcessingJob, Comment, Like, WatchHistory, VideoAnalytics
 
 
 @admin.register(Video)
@@ -16,13 +16,22 @@ class VideoAdmin(admin.ModelAdmin):
 
 @admin.register(VideoFile)
 class VideoFileAdmin(admin.ModelAdmin):
-    list_display = ('video', 'quality', 'file_size', 'bitrate', 'created_at')
+    list_display = ('video', 'quality', 'file_size', 'bitrate', 'peak_bitrate', 'created_at')
     list_filter = ('quality', 'created_at')
     search_fields = ('video__title',)
     ordering = ('-created_at',)
     raw_id_fields = ('video',)
 
 
+@admin.register(VideoProcessingJob)
+class VideoProcessingJobAdmin(admin.ModelAdmin):
+    list_display = ('video', 'attempts', 'created_at', 'updated_at')
+    search_fields = ('video__title',)
+    ordering = ('-updated_at',)
+    raw_id_fields = ('video',)
+    readonly_fields = ('created_at', 'updated_at')
+
+
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
     list_display = ('user', 'video', 'content_preview', 'likes_count', 'created_at')
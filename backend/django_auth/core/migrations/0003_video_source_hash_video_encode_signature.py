@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_alter_video_hls_master_url_alter_video_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='source_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='encode_signature',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 09:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_video_source_hash_video_encode_signature'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoProcessingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stages', models.JSONField(default=dict, help_text='Completed pipeline stages and their results')),
+                ('attempts', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('video', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='processing_job', to='core.video')),
+            ],
+            options={
+                'db_table': 'video_processing_jobs',
+            },
+        ),
+    ]
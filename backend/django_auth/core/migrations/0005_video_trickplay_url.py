@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_videoprocessingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='trickplay_url',
+            field=models.URLField(blank=True, null=True),
+        ),
+    ]
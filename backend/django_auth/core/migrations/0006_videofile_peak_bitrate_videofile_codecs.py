@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 10:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_video_trickplay_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videofile',
+            name='peak_bitrate',
+            field=models.IntegerField(default=0, help_text='Peak segment bitrate in kbps'),
+        ),
+        migrations.AddField(
+            model_name='videofile',
+            name='codecs',
+            field=models.CharField(blank=True, help_text='RFC 6381 codecs string', max_length=64, null=True),
+        ),
+    ]
@@ -47,6 +47,13 @@ class Video(models.Model):
     
     # HLS streaming
     hls_master_url = models.URLField(blank=True, null=True)
+    # WebVTT track of scrub-bar preview sprites
+    trickplay_url = models.URLField(blank=True, null=True)
+    
+    # Deduplication: SHA-256 of the uploaded source and a fingerprint of the
+    # ladder it was fully encoded with
+    source_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
+    encode_signature = models.CharField(max_length=64, blank=True, null=True)
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -82,6 +89,8 @@ class VideoFile(models.Model):
     playlist_url = models.URLField()  # HLS playlist URL
     file_size = models.BigIntegerField(default=0)
     bitrate = models.IntegerField(default=0, help_text='Bitrate in kbps')
+    peak_bitrate = models.IntegerField(default=0, help_text='Peak segment bitrate in kbps')
+    codecs = models.CharField(max_length=64, blank=True, null=True, help_text='RFC 6381 codecs string')
     
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -94,6 +103,23 @@ class VideoFile(models.Model):
         return f"{self.video.title} - {self.quality}"
 
 
+class VideoProcessingJob(models.Model):
+    """Checkpointed state of a video's processing pipeline."""
+    
+    video = models.OneToOneField(Video, on_delete=models.CASCADE, related_name='processing_job')
+    stages = models.JSONField(default=dict, help_text='Completed pipeline stages and their results')
+    attempts = models.IntegerField(default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'video_processing_jobs'
+    
+    def __str__(self):
+        return f"Processing job for {self.video.title}"
+
+
 class Comment(models.Model):
     """Video comments."""
     
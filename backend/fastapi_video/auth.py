@@ -11,6 +11,7 @@ from config import settings
 
 # HTTP Bearer token scheme
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -55,6 +56,25 @@ def get_current_user(token_data: dict = Depends(verify_token)) -> int:
     return token_data.get("user_id")
 
 
+def get_current_user_for_events(
+    token: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+) -> int:
+    """
+    Get current user ID from the Authorization header or a `token` query
+    parameter, since browsers' EventSource cannot send headers.
+    """
+    if credentials is None and token:
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return get_current_user(verify_token(credentials))
+
+
 def create_streaming_token(video_id: int, user_id: int) -> str:
     """Create a token for HLS streaming access."""
     expires = timedelta(hours=settings.VIDEO_URL_EXPIRATION_HOURS)
@@ -0,0 +1,13 @@
+"""
+Redis client shared by the routers.
+"""
+import redis.asyncio as redis
+
+from config import settings
+
+# Initialize Redis client
+redis_client = redis.Redis(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    db=settings.REDIS_DB
+)
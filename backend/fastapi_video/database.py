@@ -1,30 +1,37 @@
 """
 Database configuration and models.
 """
-from sqlalchemy import create_engine, Column, Integer, String, BigInteger, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime, Boolean, Text, JSON
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 
 from config import settings
 
-# Create database engine - don't check foreign keys since Django manages schema
-engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
+# Create async database engine (asyncpg), so queries don't block the event
+# loop - don't check foreign keys since Django manages schema. The pool is
+# per uvicorn worker process.
+engine = create_async_engine(
+    settings.async_database_url,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=True
+)
 
-# Create session
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Create session; objects stay loaded after commit since attributes cannot
+# be lazily refreshed outside of an await
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 # Create base class
 Base = declarative_base()
 
 
 # Dependency to get database session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 # Database models (read-only for FastAPI, Django manages schema)
@@ -51,6 +58,10 @@ class VideoModel(Base):
     comments_count = Column(Integer, default=0)
     
     hls_master_url = Column(String(200))
+    trickplay_url = Column(String(200))
+    
+    source_hash = Column(String(64), index=True)
+    encode_signature = Column(String(64))
     
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -68,8 +79,24 @@ class VideoFileModel(Base):
     playlist_url = Column(String(200), nullable=False)
     file_size = Column(BigInteger, default=0)
     bitrate = Column(Integer, default=0)
+    peak_bitrate = Column(Integer, default=0)
+    codecs = Column(String(64))
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ProcessingJobModel(Base):
+    """Processing job model matching Django's VideoProcessingJob model."""
+    __tablename__ = 'video_processing_jobs'
+    __table_args__ = {'extend_existing': True}
+    
+    id = Column(Integer, primary_key=True, index=True)
+    video_id = Column(Integer, nullable=False, unique=True)  # Foreign key managed by Django
+    stages = Column(JSON, nullable=False, default=dict)
+    attempts = Column(Integer, nullable=False, default=0)
     
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
 
 class WatchHistoryModel(Base):
@@ -7,7 +7,8 @@ from fastapi.responses import JSONResponse
 import time
 
 from config import settings
-from routers import videos, upload, streaming, analytics
+from middleware import BodySizeLimitMiddleware
+from routers import videos, upload, resumable, direct, streaming, analytics
 from database import engine, Base
 
 # Don't create tables - Django manages the schema
@@ -31,6 +32,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized uploads before their body is read
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_body_size=(settings.MAX_VIDEO_SIZE_MB + settings.UPLOAD_FORM_OVERHEAD_MB) * 1024 * 1024,
+    path_prefix="/api/upload"
+)
+
 
 # Request timing middleware
 @app.middleware("http")
@@ -45,10 +53,18 @@ async def add_process_time_header(request: Request, call_next):
 # Include routers
 app.include_router(videos.router, prefix="/api/videos", tags=["Videos"])
 app.include_router(upload.router, prefix="/api/upload", tags=["Upload"])
+app.include_router(resumable.router, prefix="/api/upload/sessions", tags=["Upload"])
+app.include_router(direct.router, prefix="/api/upload/direct", tags=["Upload"])
 app.include_router(streaming.router, prefix="/api/stream", tags=["Streaming"])
 app.include_router(analytics.router, prefix="/api/analytics", tags=["Analytics"])
 
 
+@app.on_event("shutdown")
+async def close_database():
+    """Close the database connection pool."""
+    await engine.dispose()
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -0,0 +1,95 @@
+"""
+ASGI middleware.
+"""
+import json
+
+from starlette.exceptions import HTTPException
+
+
+class BodyTooLarge(HTTPException):
+    """
+    Raised from receive() when a request body exceeds the limit. As an
+    HTTPException it becomes a 413 response even when raised while a
+    route is parsing the body.
+    """
+    
+    def __init__(self, detail: str):
+        super().__init__(status_code=413, detail=detail)
+
+
+class BodySizeLimitMiddleware:
+    """
+    Reject request bodies larger than max_body_size on paths starting with
+    path_prefix, before they are parsed.
+    
+    Requests whose Content-Length is too large are answered with 413 without
+    reading the body. Bodies without a usable Content-Length (chunked
+    transfer) are counted as they are received and cut off as soon as they
+    exceed the limit, so an oversized upload is never spooled in full.
+    """
+    
+    def __init__(self, app, max_body_size: int, path_prefix: str = "/"):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.path_prefix = path_prefix
+    
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] not in ("POST", "PUT", "PATCH")
+            or not scope["path"].startswith(self.path_prefix)
+        ):
+            await self.app(scope, receive, send)
+            return
+        
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None:
+            try:
+                too_large = int(content_length) > self.max_body_size
+            except ValueError:
+                await self.reject(send, 400, "Invalid Content-Length header")
+                return
+            if too_large:
+                await self.reject(send, 413, self.too_large_detail())
+                return
+        
+        received = 0
+        response_started = False
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_size:
+                    raise BodyTooLarge(self.too_large_detail())
+            return message
+        
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+        
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except BodyTooLarge as e:
+            if not response_started:
+                await self.reject(send, e.status_code, e.detail)
+    
+    def too_large_detail(self) -> str:
+        return f"Request body too large. Maximum size: {self.max_body_size // (1024 * 1024)}MB"
+    
+    @staticmethod
+    async def reject(send, status_code: int, detail: str):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
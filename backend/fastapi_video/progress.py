@@ -0,0 +1,123 @@
+"""
+Video processing progress published by the Celery workers in Redis.
+"""
+import json
+import time
+from typing import AsyncIterator, Optional
+
+from redis.exceptions import RedisError
+
+from cache import redis_client
+
+# Must match the workers' progress module
+PROGRESS_KEY = 'video:{video_id}:progress'
+PROGRESS_TTL = 24 * 3600
+EVENTS_CHANNEL = 'video:{video_id}:events'
+
+
+def progress_key(video_id: int) -> str:
+    """Redis key of a video's progress hash."""
+    return PROGRESS_KEY.format(video_id=video_id)
+
+
+def events_channel(video_id: int) -> str:
+    """Redis pub/sub channel of a video's progress events."""
+    return EVENTS_CHANNEL.format(video_id=video_id)
+
+
+async def init_progress(video) -> None:
+    """
+    Seed the progress hash of a new upload with the fields the status
+    endpoint needs, so it can answer without querying Postgres.
+    """
+    fields = {
+        'status': video.status,
+        'stage': 'queued',
+        'title': video.title,
+        'creator_id': video.creator_id,
+        'created_at': video.created_at.isoformat(),
+    }
+    try:
+        key = progress_key(video.id)
+        async with redis_client.pipeline() as pipe:
+            pipe.hset(key, mapping={name: json.dumps(value) for name, value in fields.items()})
+            pipe.expire(key, PROGRESS_TTL)
+            await pipe.execute()
+    except RedisError as e:
+        print(f"Error initializing progress: {e}")
+
+
+async def get_progress(video_id: int) -> Optional[dict]:
+    """
+    Get the progress hash of a video, with the per-rendition entries
+    grouped under 'progress'. Returns None if it is missing or Redis is
+    unavailable.
+    """
+    try:
+        fields = await redis_client.hgetall(progress_key(video_id))
+    except RedisError as e:
+        print(f"Error reading progress: {e}")
+        return None
+    
+    if not fields:
+        return None
+    
+    result = {'progress': {}}
+    for name, value in fields.items():
+        name = name.decode()
+        value = json.loads(value)
+        if name.startswith('progress:'):
+            result['progress'][name[len('progress:'):]] = value
+        else:
+            result[name] = value
+    return result
+
+
+def is_final(event: dict) -> bool:
+    """Whether an event ends processing: the video is fully published or failed."""
+    return event.get('stage') == 'done' or event.get('status') == 'failed'
+
+
+async def progress_events(
+    video_id: int,
+    heartbeat: float = 15.0,
+    idle_timeout: Optional[float] = None
+) -> AsyncIterator[Optional[dict]]:
+    """
+    Yield the progress events published by the workers for a video, as
+    partial updates of the get_progress result.
+    
+    The channel is subscribed before the current state is read, so the
+    first event is a full snapshot and no update in between is lost. None
+    is yielded after heartbeat seconds without an event, so callers can
+    keep idle connections alive. Ends after the final event, or after
+    idle_timeout seconds without one, in case a worker died without
+    publishing it.
+    """
+    pubsub = redis_client.pubsub()
+    try:
+        await pubsub.subscribe(events_channel(video_id))
+        
+        snapshot = await get_progress(video_id)
+        if snapshot:
+            snapshot.pop('creator_id', None)
+            yield snapshot
+            if is_final(snapshot):
+                return
+        
+        last_event = time.monotonic()
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=heartbeat)
+            if message is None:
+                if idle_timeout is not None and time.monotonic() - last_event >= idle_timeout:
+                    return
+                yield None
+                continue
+            
+            last_event = time.monotonic()
+            event = json.loads(message['data'])
+            yield event
+            if is_final(event):
+                return
+    finally:
+        await pubsub.reset()
@@ -2,8 +2,8 @@
 Analytics router.
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 
 from database import get_db, VideoModel, WatchHistoryModel
@@ -16,11 +16,11 @@ router = APIRouter()
 @router.get("/video/{video_id}", response_model=AnalyticsResponse)
 async def get_video_analytics(
     video_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: int = Depends(get_current_user)
 ):
     """Get analytics for a specific video."""
-    video = db.query(VideoModel).filter(VideoModel.id == video_id).first()
+    video = await db.get(VideoModel, video_id)
     
     if not video:
         raise HTTPException(
@@ -36,12 +36,12 @@ async def get_video_analytics(
         )
     
     # Get watch history stats
-    watch_stats = db.query(
+    watch_stats = (await db.execute(select(
         func.count(WatchHistoryModel.id).label('total_watches'),
         func.sum(WatchHistoryModel.watch_time).label('total_watch_time'),
         func.avg(WatchHistoryModel.watch_time).label('avg_watch_time'),
         func.count(WatchHistoryModel.id).filter(WatchHistoryModel.completed == True).label('completions')
-    ).filter(WatchHistoryModel.video_id == video_id).first()
+    ).where(WatchHistoryModel.video_id == video_id))).first()
     
     total_watch_time = watch_stats.total_watch_time or 0
     avg_watch_duration = int(watch_stats.avg_watch_time or 0)
@@ -64,13 +64,13 @@ async def get_video_analytics(
 
 @router.get("/creator")
 async def get_creator_analytics(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: int = Depends(get_current_user)
 ):
     """Get overall analytics for creator's channel."""
     
     # Get all creator's videos
-    videos = db.query(VideoModel).filter(VideoModel.creator_id == user_id).all()
+    videos = (await db.scalars(select(VideoModel).where(VideoModel.creator_id == user_id))).all()
     
     if not videos:
         return {
@@ -89,9 +89,9 @@ async def get_creator_analytics(
     total_comments = sum(v.comments_count for v in videos)
     
     # Get watch time
-    total_watch_time = db.query(
+    total_watch_time = await db.scalar(select(
         func.sum(WatchHistoryModel.watch_time)
-    ).filter(WatchHistoryModel.video_id.in_(video_ids)).scalar() or 0
+    ).where(WatchHistoryModel.video_id.in_(video_ids))) or 0
     
     return {
         "total_videos": len(videos),
@@ -115,15 +115,15 @@ async def get_creator_analytics(
 @router.get("/trending")
 async def get_trending_videos(
     days: int = 7,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get trending videos based on recent views."""
     since_date = datetime.utcnow() - timedelta(days=days)
     
-    videos = db.query(VideoModel).filter(
+    videos = (await db.scalars(select(VideoModel).where(
         VideoModel.visibility == 'public',
         VideoModel.status == 'ready',
         VideoModel.created_at >= since_date
-    ).order_by(VideoModel.views_count.desc()).limit(20).all()
+    ).order_by(VideoModel.views_count.desc()).limit(20))).all()
     
     return {"trending": videos}
@@ -0,0 +1,255 @@
+"""
+Direct-to-storage upload router.
+
+The client uploads the video straight to MinIO as a multipart upload using
+presigned part URLs, so no video bytes pass through nginx or FastAPI. The
+completion call assembles the object, creates the video and hands its
+object key to the worker.
+"""
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+import os
+import math
+import uuid
+from datetime import datetime, timedelta
+
+from database import get_db, VideoModel
+from schemas import DirectUploadCreate, DirectUploadResponse, UploadResponse
+from auth import get_current_user
+from config import settings
+from celery_tasks import process_video_task
+from cache import redis_client
+from progress import init_progress
+from validation import validate_upload, record_validation, delete_processing_job
+from storage import (
+    source_object_name,
+    create_multipart_upload,
+    presigned_part_urls,
+    list_uploaded_parts,
+    complete_multipart_upload,
+    abort_multipart_upload,
+    delete_file,
+    presigned_source_url,
+)
+
+router = APIRouter()
+
+DIRECT_UPLOAD_KEY = 'direct_upload:{upload_id}'
+
+# S3 multipart limits
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+
+async def load_direct_upload(upload_id: str, user_id: int) -> dict:
+    """Get a direct upload owned by user_id, or raise 404/403."""
+    fields = await redis_client.hgetall(DIRECT_UPLOAD_KEY.format(upload_id=upload_id))
+    
+    if not fields:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload not found"
+        )
+    
+    upload = {name.decode(): value.decode() for name, value in fields.items()}
+    if int(upload['user_id']) != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    
+    return upload
+
+
+@router.post("/", response_model=DirectUploadResponse, status_code=status.HTTP_201_CREATED)
+async def create_direct_upload(
+    upload: DirectUploadCreate,
+    user_id: int = Depends(get_current_user)
+):
+    """
+    Start a direct upload: returns a presigned PUT URL for every part. Part
+    N covers bytes [(N-1) * part_size, N * part_size) of the file.
+    """
+    filename = os.path.basename(upload.filename)
+    file_extension = filename.split('.')[-1].lower()
+    if file_extension not in settings.allowed_formats_list:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid file format. Allowed formats: {', '.join(settings.allowed_formats_list)}"
+        )
+    
+    if upload.size > settings.MAX_VIDEO_SIZE_MB * 1024 * 1024:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File too large. Maximum size: {settings.MAX_VIDEO_SIZE_MB}MB"
+        )
+    
+    part_size = max(
+        settings.DIRECT_UPLOAD_PART_SIZE_MB * 1024 * 1024,
+        MIN_PART_SIZE,
+        math.ceil(upload.size / MAX_PARTS)
+    )
+    part_count = math.ceil(upload.size / part_size)
+    
+    upload_id = uuid.uuid4().hex
+    object_key = source_object_name(upload_id, filename)
+    expires = timedelta(hours=settings.DIRECT_UPLOAD_URL_EXPIRATION_HOURS)
+    expires_at = datetime.utcnow() + expires
+    
+    try:
+        multipart_id = await run_in_threadpool(create_multipart_upload, object_key, upload.content_type)
+        urls = await run_in_threadpool(presigned_part_urls, object_key, multipart_id, part_count, expires)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Could not start upload: {str(e)}"
+        )
+    
+    key = DIRECT_UPLOAD_KEY.format(upload_id=upload_id)
+    try:
+        async with redis_client.pipeline() as pipe:
+            pipe.hset(key, mapping={
+                'user_id': user_id,
+                'object_key': object_key,
+                'multipart_id': multipart_id,
+                'filename': filename,
+                'size': upload.size,
+                'title': upload.title,
+                'description': upload.description or '',
+                'visibility': upload.visibility,
+                'segment_format': upload.segment_format,
+            })
+            pipe.expireat(key, int(expires_at.timestamp()))
+            await pipe.execute()
+    except Exception:
+        # Without its session the upload could never be completed or aborted
+        await run_in_threadpool(abort_multipart_upload, object_key, multipart_id)
+        raise
+    
+    return {
+        "upload_id": upload_id,
+        "object_key": object_key,
+        "part_size": part_size,
+        "parts": [
+            {"part_number": part_number, "url": url}
+            for part_number, url in enumerate(urls, start=1)
+        ],
+        "expires_at": expires_at
+    }
+
+
+@router.post("/{upload_id}/complete", response_model=UploadResponse)
+async def complete_direct_upload(
+    upload_id: str,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user)
+):
+    """
+    Assemble the uploaded parts into the source object, create the video and
+    start processing from the object key.
+    
+    Parts are listed from storage rather than taken from the client, and
+    their total size must match the size declared at the start.
+    """
+    upload = await load_direct_upload(upload_id, user_id)
+    key = DIRECT_UPLOAD_KEY.format(upload_id=upload_id)
+    object_key = upload['object_key']
+    
+    # Only one completion may assemble the object
+    if not await redis_client.hsetnx(key, 'completing', 1):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload is already being completed"
+        )
+    
+    try:
+        parts = await run_in_threadpool(list_uploaded_parts, object_key, upload['multipart_id'])
+    except Exception as e:
+        await redis_client.hdel(key, 'completing')
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"Could not list uploaded parts: {str(e)}"
+        )
+    
+    uploaded_size = sum(part.size for part in parts)
+    if uploaded_size != int(upload['size']):
+        await redis_client.hdel(key, 'completing')
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Incomplete upload: received {uploaded_size} of {upload['size']} bytes"
+        )
+    
+    if not await run_in_threadpool(complete_multipart_upload, object_key, upload['multipart_id'], parts):
+        await redis_client.hdel(key, 'completing')
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Could not assemble the uploaded parts"
+        )
+    
+    # Reject undecodable files before they reach a worker
+    try:
+        probe = await validate_upload(await run_in_threadpool(presigned_source_url, object_key))
+    except HTTPException:
+        await run_in_threadpool(delete_file, object_key)
+        await redis_client.delete(key)
+        raise
+    
+    video_id = None
+    try:
+        # Create video record in database
+        video = VideoModel(
+            title=upload['title'],
+            description=upload['description'],
+            creator_id=user_id,
+            status='processing',
+            visibility=upload['visibility'],
+            file_size=uploaded_size,
+            created_at=datetime.utcnow(),
+            updated_at=datetime.utcnow()
+        )
+        
+        db.add(video)
+        await db.commit()
+        await db.refresh(video)
+        video_id = video.id
+        await record_validation(db, video_id, probe)
+        await init_progress(video)
+        
+        # Start video processing task from the object instead of a local file
+        task = process_video_task.delay(video_id, None, upload['segment_format'], source_object=object_key)
+    
+    except Exception as e:
+        # The parts are already assembled, so the upload cannot be completed
+        # again: discard the object and the session
+        await db.rollback()
+        await run_in_threadpool(delete_file, object_key)
+        if video_id is not None:
+            await delete_processing_job(db, video_id)
+            await db.execute(delete(VideoModel).where(VideoModel.id == video_id))
+            await db.commit()
+        await redis_client.delete(key)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Upload failed: {str(e)}"
+        )
+    
+    await redis_client.delete(key)
+    
+    return {
+        "video_id": video.id,
+        "task_id": task.id,
+        "message": "Video upload successful. Processing started."
+    }
+
+
+@router.delete("/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def abort_direct_upload(
+    upload_id: str,
+    user_id: int = Depends(get_current_user)
+):
+    """Abort a direct upload and discard its uploaded parts."""
+    upload = await load_direct_upload(upload_id, user_id)
+    await run_in_threadpool(abort_multipart_upload, upload['object_key'], upload['multipart_id'])
+    await redis_client.delete(DIRECT_UPLOAD_KEY.format(upload_id=upload_id))
@@ -0,0 +1,412 @@
+"""
+Resumable upload router.
+
+A resumable upload is a session: the client creates it with the file's
+metadata, PUTs numbered chunks (in any order, in parallel), queries which
+chunks arrived to resume after a dropped connection, and completes it.
+Chunks are written at their offsets into a preallocated file, so the
+upload is assembled in place without copying, and processing only starts
+once the session is completed.
+"""
+from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+import os
+import glob
+import time
+import uuid
+import hashlib
+from datetime import datetime, timedelta
+
+from database import get_db, VideoModel
+from schemas import UploadSessionCreate, UploadSessionResponse, UploadResponse
+from auth import get_current_user
+from config import settings
+from celery_tasks import process_video_task
+from cache import redis_client
+from progress import init_progress
+from storage import upload_source, source_object_name, delete_file
+from validation import validate_upload, record_validation, delete_processing_job
+
+router = APIRouter()
+
+# Session metadata, and the SHA-256 of every received chunk by index
+SESSION_KEY = 'upload_session:{session_id}'
+CHUNKS_KEY = 'upload_session:{session_id}:chunks'
+
+# Chunk writes in progress, scored by start time; completion waits for them
+WRITERS_KEY = 'upload_session:{session_id}:writers'
+
+# A write registered longer ago than this belongs to a request that died
+WRITER_TIMEOUT = 15 * 60
+
+# Received chunk data is written to disk in pieces of this size
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+def session_path(session_id: str) -> str:
+    """Local file a session's chunks are written into."""
+    return os.path.join(settings.UPLOAD_TEMP_DIR, f"session_{session_id}.part")
+
+
+def remove_expired_sessions() -> None:
+    """
+    Delete session files not written to for longer than a session lives.
+    Their sessions have expired from Redis, so they can never be completed.
+    """
+    cutoff = time.time() - settings.UPLOAD_SESSION_TTL_HOURS * 3600
+    for path in glob.glob(os.path.join(settings.UPLOAD_TEMP_DIR, 'session_*.part')):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def chunk_count(size: int, chunk_size: int) -> int:
+    """Number of chunks a file of size bytes is split into."""
+    return (size + chunk_size - 1) // chunk_size
+
+
+def write_at(fd: int, data: bytes, offset: int) -> None:
+    """Write all of data at offset, retrying short writes."""
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+async def load_session(session_id: str, user_id: int) -> dict:
+    """Get an upload session owned by user_id, or raise 404/403."""
+    fields = await redis_client.hgetall(SESSION_KEY.format(session_id=session_id))
+    
+    if not fields:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload session not found"
+        )
+    
+    session = {name.decode(): value.decode() for name, value in fields.items()}
+    if int(session['user_id']) != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    
+    return session
+
+
+async def session_status(session_id: str, session: dict) -> dict:
+    """Describe a session and the chunks received so far."""
+    size = int(session['size'])
+    chunk_size = int(session['chunk_size'])
+    count = chunk_count(size, chunk_size)
+    
+    received = sorted(int(index) for index in await redis_client.hkeys(CHUNKS_KEY.format(session_id=session_id)))
+    
+    # Bytes received contiguously from the start, for sequential clients
+    received_set = set(received)
+    offset = 0
+    while offset < size and offset // chunk_size in received_set:
+        offset = min(offset + chunk_size, size)
+    
+    return {
+        "session_id": session_id,
+        "size": size,
+        "chunk_size": chunk_size,
+        "chunk_count": count,
+        "received_chunks": received,
+        "offset": offset,
+        "expires_at": datetime.utcfromtimestamp(int(session['expires_at']))
+    }
+
+
+@router.post("/", response_model=UploadSessionResponse, status_code=status.HTTP_201_CREATED)
+async def create_upload_session(
+    upload: UploadSessionCreate,
+    user_id: int = Depends(get_current_user)
+):
+    """Start a resumable upload."""
+    filename = os.path.basename(upload.filename)
+    file_extension = filename.split('.')[-1].lower()
+    if file_extension not in settings.allowed_formats_list:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid file format. Allowed formats: {', '.join(settings.allowed_formats_list)}"
+        )
+    
+    if upload.size > settings.MAX_VIDEO_SIZE_MB * 1024 * 1024:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File too large. Maximum size: {settings.MAX_VIDEO_SIZE_MB}MB"
+        )
+    
+    session_id = uuid.uuid4().hex
+    chunk_size = upload.chunk_size or settings.UPLOAD_SESSION_CHUNK_SIZE_MB * 1024 * 1024
+    expires_at = datetime.utcnow() + timedelta(hours=settings.UPLOAD_SESSION_TTL_HOURS)
+    
+    # Preallocate (sparsely) so chunks can be written at their offsets in any order
+    os.makedirs(settings.UPLOAD_TEMP_DIR, exist_ok=True)
+    await run_in_threadpool(remove_expired_sessions)
+    with open(session_path(session_id), 'wb') as f:
+        f.truncate(upload.size)
+    
+    session = {
+        'user_id': user_id,
+        'filename': filename,
+        'size': upload.size,
+        'chunk_size': chunk_size,
+        'title': upload.title,
+        'description': upload.description or '',
+        'visibility': upload.visibility,
+        'segment_format': upload.segment_format,
+        'checksum': upload.checksum or '',
+        'expires_at': int(expires_at.timestamp()),
+    }
+    
+    key = SESSION_KEY.format(session_id=session_id)
+    async with redis_client.pipeline() as pipe:
+        pipe.hset(key, mapping=session)
+        pipe.expireat(key, session['expires_at'])
+        await pipe.execute()
+    
+    return await session_status(session_id, {name: str(value) for name, value in session.items()})
+
+
+@router.get("/{session_id}", response_model=UploadSessionResponse)
+async def get_upload_session(
+    session_id: str,
+    user_id: int = Depends(get_current_user)
+):
+    """Get the chunks received so far, to resume an interrupted upload."""
+    session = await load_session(session_id, user_id)
+    return await session_status(session_id, session)
+
+
+@router.put("/{session_id}/chunks/{index}")
+async def upload_chunk(
+    session_id: str,
+    index: int,
+    request: Request,
+    user_id: int = Depends(get_current_user)
+):
+    """
+    Upload one chunk as the raw request body.
+    
+    Every chunk but the last must be exactly chunk_size bytes. The chunk is
+    hashed while it is streamed to its offset in the session file, and
+    checked against an optional X-Chunk-SHA256 header. Re-uploading a chunk
+    replaces it.
+    """
+    session = await load_session(session_id, user_id)
+    size = int(session['size'])
+    chunk_size = int(session['chunk_size'])
+    
+    if not 0 <= index < chunk_count(size, chunk_size):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Chunk index out of range"
+        )
+    
+    # Register the write before checking for a completion, which checks for
+    # registered writes after taking its lock, so one of the two backs off
+    writers_key = WRITERS_KEY.format(session_id=session_id)
+    writer = uuid.uuid4().hex
+    async with redis_client.pipeline() as pipe:
+        pipe.zadd(writers_key, {writer: time.time()})
+        pipe.expireat(writers_key, int(session['expires_at']))
+        pipe.hexists(SESSION_KEY.format(session_id=session_id), 'completing')
+        completing = (await pipe.execute())[-1]
+    
+    try:
+        if completing:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Upload session is being completed"
+            )
+        
+        expected_size = min(chunk_size, size - index * chunk_size)
+        offset = index * chunk_size
+        digest = hashlib.sha256()
+        received = 0
+        buffer = bytearray()
+        
+        try:
+            fd = os.open(session_path(session_id), os.O_WRONLY)
+        except FileNotFoundError:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Upload session was already completed"
+            )
+        
+        try:
+            async for data in request.stream():
+                received += len(data)
+                if received > expected_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"Chunk too large. Expected {expected_size} bytes"
+                    )
+                digest.update(data)
+                buffer += data
+                
+                if len(buffer) >= WRITE_BUFFER_SIZE:
+                    await run_in_threadpool(write_at, fd, bytes(buffer), offset)
+                    offset += len(buffer)
+                    buffer.clear()
+            
+            if buffer:
+                await run_in_threadpool(write_at, fd, bytes(buffer), offset)
+        finally:
+            os.close(fd)
+        
+        if received != expected_size:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Incomplete chunk: received {received} of {expected_size} bytes"
+            )
+        
+        chunk_hash = digest.hexdigest()
+        expected_hash = request.headers.get('x-chunk-sha256')
+        if expected_hash and expected_hash.lower() != chunk_hash:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Chunk checksum mismatch"
+            )
+        
+        chunks_key = CHUNKS_KEY.format(session_id=session_id)
+        async with redis_client.pipeline() as pipe:
+            pipe.hset(chunks_key, index, chunk_hash)
+            pipe.expireat(chunks_key, int(session['expires_at']))
+            await pipe.execute()
+    finally:
+        await redis_client.zrem(writers_key, writer)
+    
+    return {"index": index, "size": received, "sha256": chunk_hash}
+
+
+@router.post("/{session_id}/complete", response_model=UploadResponse)
+async def complete_upload_session(
+    session_id: str,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user)
+):
+    """
+    Finish a resumable upload and start processing.
+    
+    Requires every chunk. When a checksum was given at creation it is
+    verified against the recorded chunk hashes, so the file is not read
+    again; the worker fills in the whole-file source hash.
+    """
+    session = await load_session(session_id, user_id)
+    session_info = await session_status(session_id, session)
+    
+    missing = sorted(set(range(session_info['chunk_count'])) - set(session_info['received_chunks']))
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Missing chunks: {', '.join(str(index) for index in missing[:20])}"
+        )
+    
+    key = SESSION_KEY.format(session_id=session_id)
+    chunks_key = CHUNKS_KEY.format(session_id=session_id)
+    writers_key = WRITERS_KEY.format(session_id=session_id)
+    
+    # Only one completion may move the file
+    if not await redis_client.hsetnx(key, 'completing', 1):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload session is already being completed"
+        )
+    
+    # Chunk writes that started before the lock may still be writing the file
+    if await redis_client.zcount(writers_key, time.time() - WRITER_TIMEOUT, '+inf'):
+        await redis_client.hdel(key, 'completing')
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Chunks are still being uploaded"
+        )
+    
+    if session['checksum']:
+        digests = await redis_client.hmget(chunks_key, list(range(session_info['chunk_count'])))
+        checksum = hashlib.sha256(b''.join(bytes.fromhex(d.decode()) for d in digests)).hexdigest()
+        if checksum != session['checksum']:
+            await redis_client.hdel(key, 'completing')
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Upload checksum mismatch"
+            )
+    
+    # Reject undecodable files before they reach a worker; the chunks are
+    # kept so a wrong chunk can be re-uploaded
+    try:
+        probe = await validate_upload(session_path(session_id))
+    except HTTPException:
+        await redis_client.hdel(key, 'completing')
+        raise
+    
+    # Create video record in database
+    video = VideoModel(
+        title=session['title'],
+        description=session['description'],
+        creator_id=user_id,
+        status='processing',
+        visibility=session['visibility'],
+        file_size=session_info['size'],
+        created_at=datetime.utcnow(),
+        updated_at=datetime.utcnow()
+    )
+    
+    db.add(video)
+    await db.commit()
+    await db.refresh(video)
+    await record_validation(db, video.id, probe)
+    
+    source_object = source_object_name(session_id, session['filename'])
+    
+    try:
+        # Hand the assembled file to the workers through object storage
+        await run_in_threadpool(upload_source, source_object, session_path(session_id))
+        await init_progress(video)
+        
+        # Start video processing task from the source object
+        task = process_video_task.delay(video.id, None, session['segment_format'], source_object=source_object)
+    
+    except Exception as e:
+        # Keep the session so the completion can be retried
+        await run_in_threadpool(delete_file, source_object)
+        await redis_client.hdel(key, 'completing')
+        await delete_processing_job(db, video.id)
+        await db.delete(video)
+        await db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Upload failed: {str(e)}"
+        )
+    
+    os.remove(session_path(session_id))
+    await redis_client.delete(key, chunks_key, writers_key)
+    
+    return {
+        "video_id": video.id,
+        "task_id": task.id,
+        "message": "Video upload successful. Processing started."
+    }
+
+
+@router.delete("/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def abort_upload_session(
+    session_id: str,
+    user_id: int = Depends(get_current_user)
+):
+    """Abort a resumable upload and discard its chunks."""
+    await load_session(session_id, user_id)
+    
+    await redis_client.delete(
+        SESSION_KEY.format(session_id=session_id),
+        CHUNKS_KEY.format(session_id=session_id),
+        WRITERS_KEY.format(session_id=session_id)
+    )
+    if os.path.exists(session_path(session_id)):
+        os.remove(session_path(session_id))
@@ -2,7 +2,8 @@
 Video streaming router.
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta
 
 from database import get_db, VideoModel, WatchHistoryModel
@@ -16,11 +17,11 @@ router = APIRouter()
 @router.get("/token/{video_id}", response_model=StreamingToken)
 async def get_streaming_token(
     video_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: int = Depends(get_current_user)
 ):
     """Generate streaming token for HLS playback."""
-    video = db.query(VideoModel).filter(VideoModel.id == video_id).first()
+    video = await db.get(VideoModel, video_id)
     
     if not video:
         raise HTTPException(
@@ -58,16 +59,16 @@ async def get_streaming_token(
 @router.post("/progress")
 async def update_watch_progress(
     progress: WatchProgress,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: int = Depends(get_current_user)
 ):
     """Update user's watch progress."""
     
     # Check if watch history exists
-    watch_history = db.query(WatchHistoryModel).filter(
+    watch_history = await db.scalar(select(WatchHistoryModel).where(
         WatchHistoryModel.user_id == user_id,
         WatchHistoryModel.video_id == progress.video_id
-    ).first()
+    ))
     
     if watch_history:
         # Update existing record
@@ -86,19 +87,19 @@ async def update_watch_progress(
         )
         db.add(watch_history)
     
-    db.commit()
+    await db.commit()
     
     return {"message": "Watch progress updated successfully"}
 
 
 @router.get("/history")
 async def get_watch_history(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: int = Depends(get_current_user)
 ):
     """Get user's watch history."""
-    history = db.query(WatchHistoryModel).filter(
+    history = (await db.scalars(select(WatchHistoryModel).where(
         WatchHistoryModel.user_id == user_id
-    ).order_by(WatchHistoryModel.updated_at.desc()).limit(50).all()
+    ).order_by(WatchHistoryModel.updated_at.desc()).limit(50))).all()
     
     return {"history": history}
@@ -1,22 +1,41 @@
 """
 Video upload router.
 """
-from fastapi import APIRouter, File, UploadFile, Depends, HTTPException, status, Form
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, File, UploadFile, Depends, HTTPException, status, Form, Request
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 import aiofiles
 import os
 import io
+import json
+import hashlib
+import uuid
 from datetime import datetime
 
-from database import get_db, VideoModel
+from database import get_db, SessionLocal, VideoModel
 from schemas import UploadResponse
-from auth import get_current_user
+from auth import get_current_user, get_current_user_for_events
 from config import settings
 from celery_tasks import process_video_task
-from storage import upload_file
+from storage import upload_file, upload_source, source_object_name, delete_file
+from progress import init_progress, get_progress, progress_events
+from validation import validate_upload, record_validation, delete_processing_job
 
 router = APIRouter()
 
+# Read size when copying uploads to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# HLS segment formats the worker can produce
+SEGMENT_FORMATS = ('ts', 'fmp4')
+
+# Seconds between keep-alive comments on idle event streams
+EVENTS_HEARTBEAT = 15.0
+# Event streams without any progress for this long are closed; EventSource
+# clients reconnect and get a fresh snapshot
+EVENTS_IDLE_TIMEOUT = 600.0
+
 
 @router.post("/", response_model=UploadResponse)
 async def upload_video(
@@ -25,10 +44,20 @@ async def upload_video(
     description: str = Form(""),
     visibility: str = Form("public"),
     thumbnail: UploadFile = File(None),
-    db: Session = Depends(get_db),
+    segment_format: str = Form("ts"),
+    db: AsyncSession = Depends(get_db),
     user_id: int = Depends(get_current_user)
 ):
-    """Upload video file and start processing."""
+    """
+    Upload video file and start processing.
+    
+    The video is streamed to disk in UPLOAD_CHUNK_SIZE pieces while it is
+    hashed, and rejected as soon as it is known to exceed the size limit:
+    from its declared size before anything is written, otherwise from the
+    running byte count. Oversized request bodies are already refused by
+    BodySizeLimitMiddleware before they are parsed.
+    """
+    max_size = settings.MAX_VIDEO_SIZE_MB * 1024 * 1024
     
     # Validate file type
     file_extension = file.filename.split('.')[-1].lower()
@@ -38,6 +67,18 @@ async def upload_video(
             detail=f"Invalid file format. Allowed formats: {', '.join(settings.allowed_formats_list)}"
         )
     
+    if segment_format not in SEGMENT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid segment format. Allowed formats: {', '.join(SEGMENT_FORMATS)}"
+        )
+    
+    if file.size is not None and file.size > max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File too large. Maximum size: {settings.MAX_VIDEO_SIZE_MB}MB"
+        )
+    
     # Create video record in database
     video = VideoModel(
         title=title,
@@ -50,8 +91,8 @@ async def upload_video(
     )
     
     db.add(video)
-    db.commit()
-    db.refresh(video)
+    await db.commit()
+    await db.refresh(video)
     
     # Handle thumbnail upload if provided
     if thumbnail and thumbnail.filename:
@@ -75,44 +116,55 @@ async def upload_video(
                 
                 # Upload to MinIO
                 object_name = f"thumbnails/{thumbnail_filename}"
-                if upload_file(object_name, thumb_bytes, content_type):
+                if await run_in_threadpool(upload_file, object_name, thumb_bytes, content_type):
                     # Store relative path in database
                     video.thumbnail = object_name
-                    db.commit()
+                    await db.commit()
                 else:
                     print(f"Failed to upload thumbnail to MinIO")
             except Exception as e:
                 print(f"Failed to save thumbnail: {str(e)}")
     
-    # Save uploaded file temporarily
+    # Save uploaded file temporarily, then hand it to the workers through
+    # object storage so they need no volume shared with the API
     temp_file_path = os.path.join(
         settings.UPLOAD_TEMP_DIR,
         f"{video.id}_{file.filename}"
     )
+    source_object = source_object_name(uuid.uuid4().hex, file.filename)
     
     try:
+        # Hash the source while copying it so the worker can reuse an
+        # earlier encode of the same file
+        source_hash = hashlib.sha256()
+        file_size = 0
         async with aiofiles.open(temp_file_path, 'wb') as out_file:
-            content = await file.read()
-            await out_file.write(content)
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                # Stop as soon as the limit is crossed
+                file_size += len(chunk)
+                if file_size > max_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File too large. Maximum size: {settings.MAX_VIDEO_SIZE_MB}MB"
+                    )
+                source_hash.update(chunk)
+                await out_file.write(chunk)
         
-        file_size = os.path.getsize(temp_file_path)
+        # Reject undecodable files before they reach a worker
+        probe = await validate_upload(temp_file_path)
         
-        # Check file size
-        if file_size > settings.MAX_VIDEO_SIZE_MB * 1024 * 1024:
-            os.remove(temp_file_path)
-            db.delete(video)
-            db.commit()
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"File too large. Maximum size: {settings.MAX_VIDEO_SIZE_MB}MB"
-            )
+        await run_in_threadpool(upload_source, source_object, temp_file_path, file.content_type or 'application/octet-stream')
+        os.remove(temp_file_path)
         
-        # Update file size
+        # Update file size and content hash
         video.file_size = file_size
-        db.commit()
+        video.source_hash = source_hash.hexdigest()
+        await db.commit()
+        await record_validation(db, video.id, probe)
+        await init_progress(video)
         
-        # Start video processing task
-        task = process_video_task.delay(video.id, temp_file_path)
+        # Start video processing task from the source object
+        task = process_video_task.delay(video.id, None, segment_format, source_object=source_object)
         
         return {
             "video_id": video.id,
@@ -124,8 +176,12 @@ async def upload_video(
         # Clean up on error
         if os.path.exists(temp_file_path):
             os.remove(temp_file_path)
-        db.delete(video)
-        db.commit()
+        await run_in_threadpool(delete_file, source_object)
+        await delete_processing_job(db, video.id)
+        await db.delete(video)
+        await db.commit()
+        if isinstance(e, HTTPException):
+            raise
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Upload failed: {str(e)}"
@@ -135,11 +191,34 @@ async def upload_video(
 @router.get("/status/{video_id}")
 async def get_upload_status(
     video_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: int = Depends(get_current_user)
 ):
-    """Get video processing status."""
-    video = db.query(VideoModel).filter(VideoModel.id == video_id).first()
+    """
+    Get video processing status.
+    
+    While a video is processing, the status and live encode progress
+    (percent, encode fps and ETA per rendition) are served from Redis
+    without querying the database.
+    """
+    cached = await get_progress(video_id)
+    if cached and 'creator_id' in cached:
+        if cached['creator_id'] != user_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Access denied"
+            )
+        
+        return {
+            "video_id": video_id,
+            "status": cached.get('status'),
+            "title": cached.get('title'),
+            "created_at": cached.get('created_at'),
+            "stage": cached.get('stage'),
+            "progress": cached['progress']
+        }
+    
+    video = await db.get(VideoModel, video_id)
     
     if not video:
         raise HTTPException(
@@ -157,5 +236,70 @@ async def get_upload_status(
         "video_id": video.id,
         "status": video.status,
         "title": video.title,
-        "created_at": video.created_at
+        "created_at": video.created_at,
+        "stage": None,
+        "progress": {}
     }
+
+
+@router.get("/events/{video_id}")
+async def stream_upload_events(
+    video_id: int,
+    request: Request,
+    user_id: int = Depends(get_current_user_for_events)
+):
+    """
+    Stream video processing status as server-sent events.
+    
+    Replaces polling the status endpoint: the worker publishes stage changes
+    and encode progress on a Redis channel, which is relayed as `progress`
+    events (the first one a full snapshot, later ones partial updates) until
+    the video is fully processed or has failed. The token can be passed as
+    a `token` query parameter for EventSource clients.
+    """
+    cached = await get_progress(video_id)
+    finished = None
+    if cached and 'creator_id' in cached:
+        creator_id = cached['creator_id']
+    else:
+        # Short-lived session, so no connection is held while streaming
+        async with SessionLocal() as db:
+            video = await db.get(VideoModel, video_id)
+            creator_id = video.creator_id if video else None
+            # Progress has expired, so only a finished video's status is known
+            if video and video.status != 'processing':
+                finished = {"status": video.status, "stage": "done", "progress": {}}
+        
+        if creator_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Video not found"
+            )
+    
+    if creator_id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    
+    async def event_stream():
+        if finished:
+            yield f"event: progress\ndata: {json.dumps(finished)}\n\n"
+            return
+        async for event in progress_events(video_id, heartbeat=EVENTS_HEARTBEAT, idle_timeout=EVENTS_IDLE_TIMEOUT):
+            if await request.is_disconnected():
+                break
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Let nginx pass events through unbuffered
+            "X-Accel-Buffering": "no"
+        }
+    )
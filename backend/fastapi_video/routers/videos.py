@@ -2,12 +2,14 @@
 Video management router.
 """
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 
 from database import get_db, VideoModel
 from schemas import VideoResponse, VideoListResponse, VideoCreate, VideoUpdate
 from auth import get_current_user
+from validation import delete_processing_job
 
 router = APIRouter()
 
@@ -20,25 +22,25 @@ async def list_videos(
     status: Optional[str] = None,
     search: Optional[str] = None,
     sort_by: Optional[str] = Query(None, regex="^(recent|views|likes)$"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """List videos with pagination, filters, and search."""
-    query = db.query(VideoModel).filter(VideoModel.visibility == 'public')
+    query = select(VideoModel).where(VideoModel.visibility == 'public')
     
     if creator_id:
-        query = query.filter(VideoModel.creator_id == creator_id)
+        query = query.where(VideoModel.creator_id == creator_id)
     
     if status:
-        query = query.filter(VideoModel.status == status)
+        query = query.where(VideoModel.status == status)
     
     if search:
         search_term = f"%{search}%"
-        query = query.filter(
+        query = query.where(
             (VideoModel.title.ilike(search_term)) | 
             (VideoModel.description.ilike(search_term))
         )
     
-    total = query.count()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
     # Apply sorting
     if sort_by == "views":
@@ -48,9 +50,9 @@ async def list_videos(
     else:  # recent or default
         query = query.order_by(VideoModel.created_at.desc())
     
-    videos = query.offset((page - 1) * page_size)\
-        .limit(page_size)\
-        .all()
+    videos = (await db.scalars(
+        query.offset((page - 1) * page_size).limit(page_size)
+    )).all()
     
     return {
         "total": total,
@@ -63,11 +65,11 @@ async def list_videos(
 @router.get("/{video_id}", response_model=VideoResponse)
 async def get_video(
     video_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: Optional[int] = Depends(get_current_user)
 ):
     """Get video by ID."""
-    video = db.query(VideoModel).filter(VideoModel.id == video_id).first()
+    video = await db.get(VideoModel, video_id)
     
     if not video:
         raise HTTPException(
@@ -84,7 +86,7 @@ async def get_video(
     
     # Increment view count
     video.views_count += 1
-    db.commit()
+    await db.commit()
     
     return video
 
@@ -93,11 +95,11 @@ async def get_video(
 async def update_video(
     video_id: int,
     video_update: VideoUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: int = Depends(get_current_user)
 ):
     """Update video metadata."""
-    video = db.query(VideoModel).filter(VideoModel.id == video_id).first()
+    video = await db.get(VideoModel, video_id)
     
     if not video:
         raise HTTPException(
@@ -116,8 +118,8 @@ async def update_video(
     for field, value in update_data.items():
         setattr(video, field, value)
     
-    db.commit()
-    db.refresh(video)
+    await db.commit()
+    await db.refresh(video)
     
     return video
 
@@ -125,11 +127,11 @@ async def update_video(
 @router.delete("/{video_id}")
 async def delete_video(
     video_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     user_id: int = Depends(get_current_user)
 ):
     """Delete video."""
-    video = db.query(VideoModel).filter(VideoModel.id == video_id).first()
+    video = await db.get(VideoModel, video_id)
     
     if not video:
         raise HTTPException(
@@ -143,8 +145,9 @@ async def delete_video(
             detail="Not authorized to delete this video"
         )
     
-    db.delete(video)
-    db.commit()
+    await delete_processing_job(db, video.id)
+    await db.delete(video)
+    await db.commit()
     
     return {"message": "Video deleted successfully"}
 
@@ -154,20 +157,21 @@ async def get_creator_videos(
     creator_id: int,
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get all videos from a creator."""
-    query = db.query(VideoModel).filter(
+    query = select(VideoModel).where(
         VideoModel.creator_id == creator_id,
         VideoModel.visibility.in_(['public', 'unlisted'])
     )
     
-    total = query.count()
+    total = await db.scalar(select(func.count()).select_from(query.subquery()))
     
-    videos = query.order_by(VideoModel.created_at.desc())\
-        .offset((page - 1) * page_size)\
-        .limit(page_size)\
-        .all()
+    videos = (await db.scalars(
+        query.order_by(VideoModel.created_at.desc())
+        .offset((page - 1) * page_size)
+        .limit(page_size)
+    )).all()
     
     return {
         "total": total,
@@ -31,6 +31,8 @@ class VideoFile(BaseModel):
     playlist_url: str
     file_size: int
     bitrate: int
+    peak_bitrate: int = 0
+    codecs: Optional[str] = None
     
     class Config:
         from_attributes = True
@@ -49,6 +51,7 @@ class VideoResponse(VideoBase):
     dislikes_count: int = 0
     comments_count: int = 0
     hls_master_url: Optional[str] = None
+    trickplay_url: Optional[str] = None
     created_at: datetime
     updated_at: datetime
     published_at: Optional[datetime] = None
@@ -72,6 +75,50 @@ class UploadResponse(BaseModel):
     message: str
 
 
+class UploadSessionCreate(VideoBase):
+    """Schema for starting a resumable upload."""
+    filename: str = Field(..., max_length=200)
+    size: int = Field(..., gt=0)
+    segment_format: str = Field(default="ts", pattern="^(ts|fmp4)$")
+    chunk_size: Optional[int] = Field(default=None, ge=1024 * 1024, le=64 * 1024 * 1024)
+    # SHA-256 over the concatenated SHA-256 digests of the chunks, in order
+    checksum: Optional[str] = Field(default=None, pattern="^[0-9a-f]{64}$")
+
+
+class UploadSessionResponse(BaseModel):
+    """Schema for a resumable upload session."""
+    session_id: str
+    size: int
+    chunk_size: int
+    chunk_count: int
+    received_chunks: List[int] = []
+    offset: int = 0
+    expires_at: datetime
+
+
+class DirectUploadCreate(VideoBase):
+    """Schema for starting a direct-to-storage upload."""
+    filename: str = Field(..., max_length=200)
+    size: int = Field(..., gt=0)
+    content_type: str = "application/octet-stream"
+    segment_format: str = Field(default="ts", pattern="^(ts|fmp4)$")
+
+
+class DirectUploadPart(BaseModel):
+    """Schema for a presigned part URL."""
+    part_number: int
+    url: str
+
+
+class DirectUploadResponse(BaseModel):
+    """Schema for a direct-to-storage upload."""
+    upload_id: str
+    object_key: str
+    part_size: int
+    parts: List[DirectUploadPart]
+    expires_at: datetime
+
+
 class StreamingToken(BaseModel):
     """Schema for streaming token."""
     token: str
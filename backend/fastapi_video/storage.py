@@ -2,9 +2,12 @@
 MinIO storage utilities.
 """
 from minio import Minio
+from minio.datatypes import Part
 from minio.error import S3Error
 import io
-from typing import BinaryIO
+import os
+from datetime import timedelta
+from typing import BinaryIO, List, Optional
 
 from config import settings
 
@@ -16,6 +19,16 @@ minio_client = Minio(
     secure=settings.MINIO_USE_SSL
 )
 
+# Signs presigned URLs for clients, which reach MinIO on its public
+# endpoint; signing is offline since the region is given
+public_minio_client = Minio(
+    settings.MINIO_PUBLIC_ENDPOINT,
+    access_key=settings.MINIO_ACCESS_KEY,
+    secret_key=settings.MINIO_SECRET_KEY,
+    secure=settings.MINIO_PUBLIC_USE_SSL,
+    region=settings.MINIO_REGION
+)
+
 
 def ensure_bucket_exists():
     """Create bucket if it doesn't exist."""
@@ -64,6 +77,33 @@ def get_file_url(object_name: str, expires: int = 3600):
         return None
 
 
+def source_object_name(upload_id: str, filename: str) -> str:
+    """
+    Object key an upload's source video is stored under for the workers.
+    Every upload mode keys its source by a unique upload ID under uploads/.
+    """
+    return f"uploads/{upload_id}/{os.path.basename(filename)}"
+
+
+def upload_source(object_name: str, file_path: str, content_type: str = 'application/octet-stream'):
+    """
+    Upload a source video from a local file, as a multipart upload for large
+    files. Raises S3Error on failure, since processing cannot start without it.
+    """
+    ensure_bucket_exists()
+    minio_client.fput_object(
+        settings.MINIO_BUCKET_NAME,
+        object_name,
+        file_path,
+        content_type=content_type
+    )
+
+
+def presigned_source_url(object_name: str, expires: timedelta = timedelta(minutes=10)) -> str:
+    """Presigned GET URL on the internal endpoint, for probing an object in place."""
+    return minio_client.presigned_get_object(settings.MINIO_BUCKET_NAME, object_name, expires=expires)
+
+
 def delete_file(object_name: str):
     """Delete file from MinIO."""
     try:
@@ -86,3 +126,74 @@ def list_files(prefix: str = ""):
     except S3Error as e:
         print(f"Error listing files: {e}")
         return []
+
+
+# The multipart helpers below use Minio's private multipart methods, which
+# have no public equivalent; keep the minio version pinned in requirements.txt
+
+
+def create_multipart_upload(object_name: str, content_type: str = 'application/octet-stream') -> str:
+    """Start a multipart upload and return its upload ID."""
+    ensure_bucket_exists()
+    return minio_client._create_multipart_upload(
+        settings.MINIO_BUCKET_NAME,
+        object_name,
+        {"Content-Type": content_type}
+    )
+
+
+def presigned_part_urls(object_name: str, upload_id: str, part_count: int, expires: timedelta) -> List[str]:
+    """Presigned PUT URLs for parts 1..part_count of a multipart upload."""
+    return [
+        public_minio_client.get_presigned_url(
+            "PUT",
+            settings.MINIO_BUCKET_NAME,
+            object_name,
+            expires=expires,
+            extra_query_params={"uploadId": upload_id, "partNumber": str(part_number)}
+        )
+        for part_number in range(1, part_count + 1)
+    ]
+
+
+def list_uploaded_parts(object_name: str, upload_id: str) -> List[Part]:
+    """Parts uploaded so far to a multipart upload, in part number order."""
+    parts = []
+    marker = None
+    while True:
+        result = minio_client._list_parts(
+            settings.MINIO_BUCKET_NAME,
+            object_name,
+            upload_id,
+            max_parts=1000,
+            part_number_marker=marker
+        )
+        parts.extend(result.parts)
+        if not result.is_truncated:
+            return parts
+        marker = result.next_part_number_marker
+
+
+def complete_multipart_upload(object_name: str, upload_id: str, parts: List[Part]) -> Optional[str]:
+    """Assemble a multipart upload from its parts; returns the object ETag."""
+    try:
+        result = minio_client._complete_multipart_upload(
+            settings.MINIO_BUCKET_NAME,
+            object_name,
+            upload_id,
+            [Part(part.part_number, part.etag) for part in parts]
+        )
+        return result.etag
+    except S3Error as e:
+        print(f"Error completing multipart upload: {e}")
+        return None
+
+
+def abort_multipart_upload(object_name: str, upload_id: str) -> bool:
+    """Abort a multipart upload and discard its parts."""
+    try:
+        minio_client._abort_multipart_upload(settings.MINIO_BUCKET_NAME, object_name, upload_id)
+        return True
+    except S3Error as e:
+        print(f"Error aborting multipart upload: {e}")
+        return False
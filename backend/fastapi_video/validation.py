@@ -0,0 +1,138 @@
+"""
+Ingest-time validation of uploaded videos.
+
+Uploads are probed before their processing task is enqueued, so files
+that cannot be decoded are rejected immediately instead of failing deep
+inside a worker after occupying an encode slot.
+"""
+import re
+import asyncio
+import json
+from datetime import datetime
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database import ProcessingJobModel
+
+# A URL's query string, which carries the signature of a presigned URL
+URL_QUERY = re.compile(r'(https?://[^\s?\'"]+)\?[^\s\'"]*[^\s\'":]')
+
+
+class InvalidVideo(Exception):
+    """Raised when an upload is not a decodable video."""
+
+
+async def run_probe(cmd: list, timeout: float) -> bytes:
+    """Run a probe command and return its stdout; raises InvalidVideo on failure or timeout."""
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise InvalidVideo(f"probe timed out after {timeout:g}s")
+    
+    if process.returncode:
+        # Direct uploads are probed through a presigned URL, which ffmpeg
+        # echoes in its errors
+        message = URL_QUERY.sub(r'\1', stderr.decode(errors='replace')).strip().splitlines()
+        raise InvalidVideo(message[-1] if message else f"{cmd[0]} failed")
+    return stdout
+
+
+async def probe_upload(source: str) -> dict:
+    """
+    Probe a local file or URL within bounded time and data.
+    
+    ffprobe reads at most UPLOAD_PROBE_SIZE_MB to find the streams, then a
+    single video frame is decoded, so a file with a valid header but an
+    undecodable stream is caught too. Returns a summary of the source, as
+    recorded in the job's 'validate' stage. Raises InvalidVideo.
+    """
+    probe_size = str(settings.UPLOAD_PROBE_SIZE_MB * 1024 * 1024)
+    timeout = settings.UPLOAD_PROBE_TIMEOUT_SECONDS
+    
+    stdout = await run_probe([
+        'ffprobe',
+        '-v', 'error',
+        '-probesize', probe_size,
+        '-show_entries', 'format=format_name,duration,bit_rate'
+                         ':stream=codec_type,codec_name,width,height,avg_frame_rate',
+        '-of', 'json',
+        source
+    ], timeout)
+    
+    try:
+        data = json.loads(stdout)
+    except ValueError:
+        raise InvalidVideo("unreadable ffprobe output")
+    
+    streams = data.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    if video is None:
+        raise InvalidVideo("no video stream")
+    
+    await run_probe([
+        'ffmpeg',
+        '-v', 'error',
+        '-xerror',
+        '-probesize', probe_size,
+        '-i', source,
+        '-map', '0:v:0',
+        '-frames:v', '1',
+        '-f', 'null',
+        '-'
+    ], timeout)
+    
+    fmt = data.get('format', {})
+    return {
+        'format': fmt.get('format_name'),
+        'duration': float(fmt.get('duration') or 0),
+        'bit_rate': int(fmt.get('bit_rate') or 0),
+        'video': {
+            'codec': video.get('codec_name'),
+            'width': video.get('width'),
+            'height': video.get('height'),
+            'frame_rate': video.get('avg_frame_rate'),
+        },
+        'audio': [s.get('codec_name') for s in streams if s.get('codec_type') == 'audio'],
+        'validated_at': datetime.utcnow().isoformat(),
+    }
+
+
+async def validate_upload(source: str) -> dict:
+    """Probe an upload, or raise 400 if it is not a decodable video."""
+    try:
+        return await probe_upload(source)
+    except InvalidVideo as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid video file: {e}"
+        )
+
+
+async def record_validation(db: AsyncSession, video_id: int, result: dict) -> None:
+    """Create the video's processing job with the probe result as its 'validate' stage."""
+    now = datetime.utcnow()
+    await db.execute(
+        pg_insert(ProcessingJobModel)
+        .values(video_id=video_id, stages={'validate': result}, attempts=0, created_at=now, updated_at=now)
+        .on_conflict_do_nothing(index_elements=['video_id'])
+    )
+    await db.commit()
+
+
+async def delete_processing_job(db: AsyncSession, video_id: int) -> None:
+    """
+    Delete the video's processing job, which must go before the video: its
+    foreign key does not cascade. The caller commits.
+    """
+    await db.execute(delete(ProcessingJobModel).where(ProcessingJobModel.video_id == video_id))
@@ -1,7 +1,7 @@
 """
 Database models for Celery workers.
 """
-from sqlalchemy import Column, Integer, String, BigInteger, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, String, BigInteger, DateTime, Boolean, Text, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 
@@ -31,6 +31,10 @@ class Video(Base):
     comments_count = Column(Integer, default=0)
     
     hls_master_url = Column(String(200))
+    trickplay_url = Column(String(200))
+    
+    source_hash = Column(String(64), index=True)
+    encode_signature = Column(String(64))
     
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
@@ -48,5 +52,21 @@ class VideoFile(Base):
     playlist_url = Column(String(200), nullable=False)
     file_size = Column(BigInteger, default=0)
     bitrate = Column(Integer, default=0)
+    peak_bitrate = Column(Integer, default=0)
+    codecs = Column(String(64))
     
     created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ProcessingJob(Base):
+    """Checkpointed processing state of a video."""
+    __tablename__ = 'video_processing_jobs'
+    __table_args__ = {'extend_existing': True}
+    
+    id = Column(Integer, primary_key=True, index=True)
+    video_id = Column(Integer, nullable=False, unique=True)  # Foreign key managed by Django
+    stages = Column(JSON, nullable=False, default=dict)
+    attempts = Column(Integer, nullable=False, default=0)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,176 @@
+"""
+Source media probing for Celery workers.
+"""
+import re
+import json
+import subprocess
+import logging
+from dataclasses import dataclass, field, asdict
+
+logger = logging.getLogger(__name__)
+
+# A URL's query string, which carries the signature of a presigned URL
+URL_QUERY = re.compile(r'(https?://[^\s?\'"]+)\?[^\s\'"]*[^\s\'":]')
+
+
+class ProbeError(Exception):
+    """Raised when ffprobe cannot read the source or it has no video."""
+
+
+def redact_urls(text):
+    """Strip the query string from every URL in text, so logs and errors do not leak presigned URLs."""
+    return URL_QUERY.sub(r'\1', str(text))
+
+
+def parse_rate(rate):
+    """Parse an ffprobe frame rate such as '30000/1001' into a float."""
+    num, _, den = (rate or '0/1').partition('/')
+    try:
+        return float(num) / float(den or 1) if float(den or 1) else 0.0
+    except ValueError:
+        return 0.0
+
+
+def parse_int(value):
+    """Parse an ffprobe integer field, which may be missing or 'N/A'."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def parse_float(value):
+    """Parse an ffprobe float field, which may be missing or 'N/A'."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+@dataclass
+class MediaInfo:
+    """
+    Everything the pipeline needs to know about a source file, gathered by
+    one ffprobe run for the headers (and one more for keyframes).
+
+    Stored with the processing job as a plain dict (see to_dict/from_dict),
+    so every stage and every worker reads the same probe result instead of
+    spawning ffprobe again. keyframes is None unless it was requested.
+    """
+    duration: float = 0.0
+    format_name: str = ''
+    size: int = 0
+    bit_rate: int = 0
+    width: int = 0
+    height: int = 0
+    fps: float = 0.0
+    video_codec: str = ''
+    video_bit_rate: int = 0
+    pix_fmt: str = ''
+    has_audio: bool = False
+    audio_codec: str = ''
+    audio_channels: int = 0
+    audio_sample_rate: int = 0
+    keyframes: list = field(default=None)
+
+    @property
+    def has_video(self):
+        return bool(self.width and self.height)
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def probe_keyframes(file_path):
+    """
+    Keyframe timestamps of the first video stream, read from its packet
+    flags without decoding. This scans the whole file, so only the video
+    packets are selected and printed as CSV.
+    """
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=print_section=0',
+        file_path
+    ]
+
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        raise ProbeError(f"ffprobe failed: {redact_urls(e.stderr.strip())}")
+
+    keyframes = []
+    for line in result.stdout.splitlines():
+        pts_time, _, flags = line.partition(',')
+        if 'K' in flags and pts_time not in ('', 'N/A'):
+            keyframes.append(float(pts_time))
+    return sorted(keyframes)
+
+
+def probe_media(file_path, keyframes=False):
+    """
+    Probe the container format and every stream header of file_path; with
+    keyframes=True the keyframe timestamps are listed too (see
+    probe_keyframes). Raises ProbeError if the file cannot be probed or has
+    no video stream.
+    """
+    entries = (
+        'format=duration,size,bit_rate,format_name'
+        ':stream=index,codec_type,codec_name,width,height,avg_frame_rate,'
+        'bit_rate,pix_fmt,channels,sample_rate'
+    )
+
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', entries,
+        '-of', 'json',
+        file_path
+    ]
+
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        data = json.loads(result.stdout)
+    except subprocess.CalledProcessError as e:
+        raise ProbeError(f"ffprobe failed: {redact_urls(e.stderr.strip())}")
+    except ValueError as e:
+        raise ProbeError(f"Unreadable ffprobe output: {e}")
+
+    streams = data.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+    if not video:
+        raise ProbeError("Source has no video stream")
+
+    fmt = data.get('format', {})
+    info = MediaInfo(
+        duration=parse_float(fmt.get('duration')),
+        format_name=fmt.get('format_name', ''),
+        size=parse_int(fmt.get('size')),
+        bit_rate=parse_int(fmt.get('bit_rate')),
+        width=parse_int(video.get('width')),
+        height=parse_int(video.get('height')),
+        fps=parse_rate(video.get('avg_frame_rate')),
+        video_codec=video.get('codec_name', ''),
+        video_bit_rate=parse_int(video.get('bit_rate')),
+        pix_fmt=video.get('pix_fmt', ''),
+        has_audio=audio is not None,
+        audio_codec=(audio or {}).get('codec_name', ''),
+        audio_channels=parse_int((audio or {}).get('channels')),
+        audio_sample_rate=parse_int((audio or {}).get('sample_rate')),
+    )
+
+    if keyframes:
+        info.keyframes = probe_keyframes(file_path)
+
+    logger.info(
+        f"Probed {redact_urls(file_path)}: {info.width}x{info.height} {info.video_codec} "
+        f"@ {info.fps:.2f}fps, {info.duration:.1f}s, audio={info.has_audio}"
+    )
+    return info
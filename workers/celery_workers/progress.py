@@ -0,0 +1,166 @@
+"""
+Encode progress reporting for Celery workers.
+"""
+import json
+import time
+import threading
+import subprocess
+import logging
+
+from media_info import parse_int, parse_float
+
+logger = logging.getLogger(__name__)
+
+# Redis hash with a video's processing status and encode progress, read by
+# the FastAPI status endpoint. Every field value is JSON encoded; progress
+# entries are stored under 'progress:<name>'.
+PROGRESS_KEY = 'video:{video_id}:progress'
+PROGRESS_TTL = 24 * 3600
+
+# Pub/sub channel on which every change to the hash is also published, as
+# {'status': ..., 'progress': {name: {...}}} with only the changed fields,
+# for the FastAPI event stream
+EVENTS_CHANNEL = 'video:{video_id}:events'
+
+
+def progress_key(video_id):
+    """Redis key of a video's progress hash."""
+    return PROGRESS_KEY.format(video_id=video_id)
+
+
+def events_channel(video_id):
+    """Redis pub/sub channel of a video's progress events."""
+    return EVENTS_CHANNEL.format(video_id=video_id)
+
+
+def run_ffmpeg(cmd, on_progress=None):
+    """
+    Run an FFmpeg command like subprocess.run(cmd, check=True, capture_output=True).
+
+    With on_progress, FFmpeg writes its machine-readable progress report
+    (-progress) to stdout and on_progress is called with every report as a
+    dict of its key=value pairs. stderr is drained on a separate thread so
+    a chatty encode cannot block on a full pipe. Raises CalledProcessError
+    with the captured stderr if FFmpeg fails.
+    """
+    if on_progress is None:
+        return subprocess.run(cmd, check=True, capture_output=True)
+
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    stderr = []
+    reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+    reader.start()
+
+    report = {}
+    for line in process.stdout:
+        key, _, value = line.decode(errors='replace').strip().partition('=')
+        report[key] = value
+        # 'progress' (continue/end) closes every report
+        if key == 'progress':
+            try:
+                on_progress(report)
+            except Exception as e:
+                logger.warning(f"Progress callback failed: {e}")
+            report = {}
+
+    returncode = process.wait()
+    reader.join()
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd, stderr=b''.join(stderr))
+    return subprocess.CompletedProcess(cmd, returncode, stderr=b''.join(stderr))
+
+
+class ProgressReporter:
+    """
+    Publish a video's processing status and encode progress to Redis, both
+    to its progress hash and as an event on its pub/sub channel.
+
+    FFmpeg reports progress several times per second; writes for an entry
+    are throttled to one per interval seconds, except the final report.
+    Redis errors are logged and ignored, since progress is informational.
+
+    Usage:
+        reporter = ProgressReporter(redis_client, video_id)
+        run_ffmpeg(cmd, reporter.tracker(['720p'], duration, fps))
+    """
+
+    def __init__(self, client, video_id, interval=1.0, ttl=PROGRESS_TTL):
+        self.client = client
+        self.key = progress_key(video_id)
+        self.channel = events_channel(video_id)
+        self.interval = interval
+        self.ttl = ttl
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def set_status(self, status, **fields):
+        """Record the video status and any other top-level fields."""
+        self._write({'status': status, **fields})
+
+    def set_stage(self, stage):
+        """Record the pipeline stage that is running."""
+        self._write({'stage': stage})
+
+    def update(self, names, percent, fps=0.0, eta=None, force=False):
+        """Record the progress of the encode producing the entries in names."""
+        now = time.monotonic()
+        throttle_key = ','.join(names)
+        with self._lock:
+            if not force and now - self._last.get(throttle_key, 0.0) < self.interval:
+                return
+            self._last[throttle_key] = now
+
+        entry = {
+            'percent': round(percent, 1),
+            'fps': round(fps, 1),
+            'eta': None if eta is None else round(eta),
+            'updated_at': round(time.time(), 3),
+        }
+        self._write({f"progress:{name}": entry for name in names})
+
+    def tracker(self, names, duration, frame_rate=0.0):
+        """
+        Progress callback for run_ffmpeg, for an encode of duration seconds
+        of source that produces the entries in names.
+
+        Position is derived from the frame count when the frame rate is
+        known, since output timestamps may be offset (chunks); otherwise
+        from the output time. The ETA comes from FFmpeg's encode speed.
+        """
+        def on_progress(report):
+            if report.get('progress') == 'end':
+                self.update(names, 100.0, eta=0, force=True)
+                return
+
+            frame = parse_int(report.get('frame'))
+            if frame_rate and frame:
+                position = frame / frame_rate
+            else:
+                position = parse_int(report.get('out_time_us')) / 1e6
+            position = min(max(position, 0.0), duration) if duration else 0.0
+
+            speed = parse_float(report.get('speed', '').rstrip('x'))
+            eta = (duration - position) / speed if speed > 0 and duration else None
+            percent = position / duration * 100 if duration else 0.0
+            self.update(names, percent, fps=parse_float(report.get('fps')), eta=eta)
+
+        return on_progress
+
+    def _write(self, fields):
+        event = {'progress': {}}
+        for name, value in fields.items():
+            if name.startswith('progress:'):
+                event['progress'][name[len('progress:'):]] = value
+            else:
+                event[name] = value
+
+        try:
+            pipe = self.client.pipeline()
+            pipe.hset(self.key, mapping={name: json.dumps(value) for name, value in fields.items()})
+            pipe.expire(self.key, self.ttl)
+            pipe.publish(self.channel, json.dumps(event))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Could not publish progress to {self.key}: {e}")
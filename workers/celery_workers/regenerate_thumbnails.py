@@ -1,13 +1,25 @@
 #!/usr/bin/env python
 """
 Script to regenerate thumbnails for existing videos
+
+Video IDs are streamed from a server-side cursor in batches. Each batch
+is processed by a pool of worker processes, its thumbnail URLs are written
+in one UPDATE and a checkpoint file records the last finished ID, so an
+interrupted run resumes where it stopped.
+
+Usage:
+    python regenerate_thumbnails.py [--workers N] [--batch-size N] [--restart]
 """
 import os
+import io
+import re
 import sys
+import json
+import argparse
 import subprocess
-import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from minio import Minio
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, select, update, or_
 from sqlalchemy.orm import sessionmaker
 
 # Add parent directory to path
@@ -22,119 +34,200 @@ MINIO_SECRET_KEY = os.getenv('MINIO_SECRET_KEY', 'minioadmin123')
 MINIO_BUCKET_NAME = os.getenv('MINIO_BUCKET_NAME', 'videos')
 MINIO_USE_SSL = os.getenv('MINIO_USE_SSL', 'False').lower() == 'true'
 
+CHECKPOINT_FILE = os.getenv('THUMBNAIL_CHECKPOINT_FILE', '/tmp/regenerate_thumbnails.json')
+DEFAULT_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', os.cpu_count() or 4))
+DEFAULT_BATCH_SIZE = int(os.getenv('THUMBNAIL_BATCH_SIZE', 200))
+
+# Quality whose first segment the thumbnail is taken from
+SOURCE_QUALITY = '360p'
+
 # Initialize
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-minio_client = Minio(
-    MINIO_ENDPOINT,
-    access_key=MINIO_ACCESS_KEY,
-    secret_key=MINIO_SECRET_KEY,
-    secure=MINIO_USE_SSL
-)
+# Created per worker process by init_worker
+minio_client = None
+
+
+def init_worker():
+    """Give each pool process its own MinIO client and connection pool."""
+    global minio_client
+    minio_client = Minio(
+        MINIO_ENDPOINT,
+        access_key=MINIO_ACCESS_KEY,
+        secret_key=MINIO_SECRET_KEY,
+        secure=MINIO_USE_SSL
+    )
+
+
+def read_object(object_name, byterange=None):
+    """
+    Read an object from MinIO into memory, or only the part given by an
+    HLS byte range ("length@offset").
+    """
+    offset, length = 0, 0
+    if byterange:
+        length, _, offset = byterange.partition('@')
+        length, offset = int(length), int(offset or 0)
+    
+    response = minio_client.get_object(MINIO_BUCKET_NAME, object_name, offset=offset, length=length)
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def first_segment(video_id):
+    """
+    Bytes of the first segment of the source quality and their FFmpeg
+    input format. The segment is found through the playlist since segment
+    names depend on how the video was encoded; for fMP4 renditions the init
+    section is prepended, and single-file renditions are read by byte range.
+    """
+    prefix = f"videos/{video_id}/{SOURCE_QUALITY}"
+    playlist = read_object(f"{prefix}/playlist.m3u8").decode()
+    
+    init = b''
+    byterange = None
+    for line in playlist.splitlines():
+        line = line.strip()
+        if line.startswith('#EXT-X-MAP:'):
+            attributes = dict(re.findall(r'([A-Z-]+)="([^"]*)"', line))
+            init = read_object(f"{prefix}/{attributes['URI']}", attributes.get('BYTERANGE'))
+        elif line.startswith('#EXT-X-BYTERANGE:'):
+            byterange = line.split(':', 1)[1]
+        elif line and not line.startswith('#'):
+            segment = read_object(f"{prefix}/{line}", byterange)
+            return init + segment, 'mp4' if init else 'mpegts'
+    raise Exception("Playlist has no segments")
 
 
 def generate_thumbnail_from_segment(video_id):
-    """Generate thumbnail from first video segment in MinIO."""
+    """
+    Generate thumbnail from first video segment in MinIO.
+    
+    The segment is piped into FFmpeg's stdin and the JPEG is read from its
+    stdout, so nothing is written to local disk. Returns (video_id,
+    object_name or None, error or None).
+    """
     try:
-        # Download first segment from 360p quality
-        segment_path = f"videos/{video_id}/360p/segment_000.ts"
-        
-        print(f"📥 Downloading segment: {segment_path}")
-        
-        # Create temp file for segment
-        temp_segment = tempfile.NamedTemporaryFile(suffix='.ts', delete=False)
-        minio_client.fget_object(
-            MINIO_BUCKET_NAME,
-            segment_path,
-            temp_segment.name
-        )
+        segment, input_format = first_segment(video_id)
         
-        # Create temp file for thumbnail
-        temp_thumb = tempfile.NamedTemporaryFile(suffix='.jpg', delete=False)
-        temp_thumb.close()
-        
-        print(f"🎨 Generating thumbnail from segment...")
-        
-        # Extract frame from segment
+        # Most representative of the segment's first frames
         cmd = [
             'ffmpeg',
-            '-i', temp_segment.name,
-            '-ss', '3',  # 3 seconds into segment
-            '-vframes', '1',
-            '-vf', 'scale=1280:720',
+            '-f', input_format,
+            '-i', 'pipe:0',
+            '-vf', 'thumbnail=90,scale=1280:720',
+            '-frames:v', '1',
             '-q:v', '2',
-            temp_thumb.name,
-            '-y'
+            '-f', 'image2pipe',
+            '-c:v', 'mjpeg',
+            'pipe:1'
         ]
         
-        result = subprocess.run(cmd, capture_output=True)
+        result = subprocess.run(cmd, input=segment, capture_output=True)
         
-        if result.returncode != 0:
-            print(f"❌ FFmpeg error: {result.stderr.decode()[:200]}")
-            return None
+        if result.returncode != 0 or not result.stdout:
+            return video_id, None, f"FFmpeg error: {result.stderr.decode()[-200:]}"
         
         # Upload to MinIO
         object_name = f"thumbnails/{video_id}.jpg"
-        
-        print(f"☁️  Uploading thumbnail to MinIO: {object_name}")
-        
-        minio_client.fput_object(
+        minio_client.put_object(
             MINIO_BUCKET_NAME,
             object_name,
-            temp_thumb.name,
+            io.BytesIO(result.stdout),
+            len(result.stdout),
             content_type='image/jpeg'
         )
         
-        # Cleanup
-        os.unlink(temp_segment.name)
-        os.unlink(temp_thumb.name)
-        
-        print(f"✅ Thumbnail generated successfully!")
-        return object_name
-        
+        return video_id, object_name, None
+    
     except Exception as e:
-        print(f"❌ Error: {e}")
-        return None
+        return video_id, None, str(e)
+
+
+def load_checkpoint():
+    """Return the saved checkpoint, or a fresh one."""
+    try:
+        with open(CHECKPOINT_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'last_id': 0, 'generated': 0, 'failed': 0}
+
+
+def save_checkpoint(checkpoint):
+    """Atomically replace the checkpoint file."""
+    tmp_path = f"{CHECKPOINT_FILE}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, CHECKPOINT_FILE)
 
 
 def main():
     """Regenerate thumbnails for all ready videos without thumbnails."""
-    db = SessionLocal()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--restart', action='store_true', help='ignore the checkpoint and start over')
+    args = parser.parse_args()
+    
+    checkpoint = {'last_id': 0, 'generated': 0, 'failed': 0} if args.restart else load_checkpoint()
+    if checkpoint['last_id']:
+        print(f"\n⏩ Resuming after video #{checkpoint['last_id']}")
+    
+    # Separate sessions: the streaming cursor keeps its own connection open
+    # while each batch is committed on the other
+    read_db = SessionLocal()
+    write_db = SessionLocal()
     
     try:
-        # Get all ready videos without thumbnails
-        videos = db.query(Video).filter(
-            Video.status == 'ready',
-            (Video.thumbnail == None) | (Video.thumbnail == '')
-        ).all()
-        
-        print(f"\n🎬 Found {len(videos)} videos without thumbnails\n")
+        # Ready videos without thumbnails, in ID order so the checkpoint is a single ID
+        query = (
+            select(Video.id)
+            .where(
+                Video.status == 'ready',
+                or_(Video.thumbnail == None, Video.thumbnail == ''),
+                Video.id > checkpoint['last_id']
+            )
+            .order_by(Video.id)
+            .execution_options(yield_per=args.batch_size)
+        )
         
-        for video in videos:
-            print(f"{'='*60}")
-            print(f"Processing Video #{video.id}: {video.title}")
-            print(f"{'='*60}")
-            
-            thumbnail_url = generate_thumbnail_from_segment(video.id)
-            
-            if thumbnail_url:
-                # Update database
-                video.thumbnail = thumbnail_url
-                db.commit()
-                print(f"💾 Database updated with thumbnail URL\n")
-            else:
-                print(f"⚠️  Failed to generate thumbnail\n")
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker) as executor:
+            for batch in read_db.execute(query).scalars().partitions():
+                results = list(executor.map(generate_thumbnail_from_segment, batch))
+                
+                updates = [{'id': video_id, 'thumbnail': url} for video_id, url, _ in results if url]
+                for video_id, _, error in results:
+                    if error:
+                        print(f"⚠️  Video #{video_id}: {error}")
+                
+                if updates:
+                    write_db.execute(update(Video), updates)
+                    write_db.commit()
+                
+                checkpoint['last_id'] = batch[-1]
+                checkpoint['generated'] += len(updates)
+                checkpoint['failed'] += len(batch) - len(updates)
+                save_checkpoint(checkpoint)
+                
+                print(
+                    f"💾 Up to video #{checkpoint['last_id']}: "
+                    f"{checkpoint['generated']} generated, {checkpoint['failed']} failed"
+                )
         
         print(f"\n{'='*60}")
-        print(f"✨ Done! Generated {len([v for v in videos if v.thumbnail])} thumbnails")
+        print(f"✨ Done! Generated {checkpoint['generated']} thumbnails ({checkpoint['failed']} failed)")
         print(f"{'='*60}\n")
-        
+    
     except Exception as e:
         print(f"❌ Database error: {e}")
-        db.rollback()
+        write_db.rollback()
     finally:
-        db.close()
+        read_db.close()
+        write_db.close()
 
 
 if __name__ == '__main__':
@@ -5,19 +5,28 @@ import os
 import sys
 import subprocess
 import shutil
-from celery import Celery
+import math
+import contextlib
+import json
+import hashlib
+import re
+from celery import Celery, chord, group
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from minio import Minio
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from minio.error import S3Error
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import logging
+import redis
 
 # Add current directory to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # Import database models
-from database_models import Video, VideoFile
+from database_models import Video, VideoFile, ProcessingJob
+from uploader import SegmentUploader, BulkUploader, create_minio_client
+from media_info import MediaInfo, ProbeError, probe_media, redact_urls
+from progress import ProgressReporter, run_ffmpeg
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -35,6 +44,20 @@ MINIO_SECRET_KEY = os.getenv('MINIO_SECRET_KEY', 'minioadmin123')
 MINIO_BUCKET_NAME = os.getenv('MINIO_BUCKET_NAME', 'videos')
 MINIO_USE_SSL = os.getenv('MINIO_USE_SSL', 'False') == 'True'
 
+# Upload segments to MinIO while FFmpeg is still encoding
+STREAMING_UPLOAD = os.getenv('VIDEO_STREAMING_UPLOAD', 'True') == 'True'
+MINIO_UPLOAD_WORKERS = int(os.getenv('MINIO_UPLOAD_WORKERS', 8))
+MINIO_UPLOAD_RETRIES = int(os.getenv('MINIO_UPLOAD_RETRIES', 3))
+# Files larger than this are sent as multipart uploads (minimum 5 MB)
+MINIO_PART_SIZE_MB = max(int(os.getenv('MINIO_PART_SIZE_MB', 16)), 5)
+# Lifetime of the presigned URLs FFmpeg reads source objects from; it must
+# outlast the longest encode task
+SOURCE_URL_EXPIRATION_HOURS = int(os.getenv('VIDEO_SOURCE_URL_EXPIRATION_HOURS', 12))
+# Upload sources live under this prefix; multipart uploads there that are
+# older than a direct upload's lifetime were abandoned by their client
+SOURCE_PREFIX = 'uploads/'
+DIRECT_UPLOAD_EXPIRATION_HOURS = int(os.getenv('DIRECT_UPLOAD_URL_EXPIRATION_HOURS', 6))
+
 # Video encoding configuration
 QUALITY_LEVELS = {
     '360p': {'resolution': '640x360', 'bitrate': '800k', 'audio_bitrate': '96k'},
@@ -45,6 +68,93 @@ QUALITY_LEVELS = {
 
 SEGMENT_DURATION = int(os.getenv('VIDEO_SEGMENT_DURATION', 10))
 
+# Encode audio once into a shared EXT-X-MEDIA group, one AAC rendition per
+# bitrate, and write video-only variants. When disabled audio is muxed into
+# every variant at the rendition's own bitrate.
+AUDIO_GROUP = os.getenv('VIDEO_AUDIO_GROUP', 'True') == 'True'
+AUDIO_BITRATES = [
+    bitrate.strip() for bitrate in os.getenv('VIDEO_AUDIO_BITRATES', '128k').split(',')
+    if bitrate.strip()
+]
+AUDIO_GROUP_ID = 'audio'
+
+# Keyframes are forced on a common grid in every rendition so segment
+# boundaries line up for ABR switching. VIDEO_FAST_START_SEGMENTS lists
+# shorter leading segment durations (e.g. "2,2") that cut startup latency;
+# later segments are VIDEO_SEGMENT_DURATION long.
+FAST_START_SEGMENTS = [
+    float(duration) for duration in os.getenv('VIDEO_FAST_START_SEGMENTS', '').split(',')
+    if duration.strip()
+]
+
+# Default HLS segment format, can be overridden per job: 'ts' writes one
+# MPEG-TS object per segment; 'fmp4' writes each rendition as a single
+# fragmented MP4 (CMAF) file addressed with EXT-X-BYTERANGE.
+SEGMENT_FORMAT = os.getenv('VIDEO_SEGMENT_FORMAT', 'ts')
+SEGMENT_FORMATS = ('ts', 'fmp4')
+
+# Per-title ladder: drop renditions above the source resolution and encode
+# the rest with capped CRF. When disabled every QUALITY_LEVELS entry is
+# encoded at its fixed bitrate.
+ADAPTIVE_LADDER = os.getenv('VIDEO_ADAPTIVE_LADDER', 'True') == 'True'
+LADDER_CRF = int(os.getenv('VIDEO_LADDER_CRF', 23))
+# Source bits per pixel per frame that is treated as full complexity
+LADDER_REFERENCE_BPP = float(os.getenv('VIDEO_LADDER_REFERENCE_BPP', 0.1))
+
+# H.264 levels as (level, max macroblocks/s, max frame size in macroblocks,
+# max High profile bitrate in kbps); renditions get the lowest level that fits
+H264_LEVELS = [
+    ('3.0', 40500, 1620, 12500),
+    ('3.1', 108000, 3600, 17500),
+    ('3.2', 216000, 5120, 25000),
+    ('4.0', 245760, 8192, 25000),
+    ('4.1', 245760, 8192, 62500),
+    ('4.2', 522240, 8704, 62500),
+    ('5.0', 589824, 22080, 168750),
+    ('5.1', 983040, 36864, 300000),
+    ('5.2', 2073600, 36864, 300000),
+]
+
+# 'single_pass' decodes the source once and writes every rendition from one
+# FFmpeg process; 'per_quality' runs one FFmpeg process per rendition;
+# 'distributed' fans each rendition out as its own Celery task;
+# 'chunked' splits long sources at keyframes and encodes the video of the
+# chunks in parallel; its audio (always a shared group) and trickplay
+# sprites are encoded once over the whole source alongside the chunks.
+ENCODE_MODE = os.getenv('VIDEO_ENCODE_MODE', 'single_pass')
+
+# Publish each rendition as soon as it is encoded, starting with the lowest,
+# instead of waiting for the whole ladder. Not used by the chunked mode,
+# where no rendition is complete before the chunks are stitched.
+PROGRESSIVE_PUBLISH = os.getenv('VIDEO_PROGRESSIVE_PUBLISH', 'True') == 'True'
+# In the single-pass mode every rendition finishes together, so getting the
+# lowest one out early means encoding it in a run of its own first, which
+# decodes the source twice. Opt-in: faster first playback for more CPU.
+PROGRESSIVE_FIRST_RENDITION = os.getenv('VIDEO_PROGRESSIVE_FIRST_RENDITION', 'False') == 'True'
+
+# Retries of process_video; each retry resumes from the last checkpoint
+PROCESS_MAX_RETRIES = int(os.getenv('VIDEO_PROCESS_MAX_RETRIES', 3))
+PROCESS_RETRY_DELAY = int(os.getenv('VIDEO_PROCESS_RETRY_DELAY', 60))
+
+# Target chunk length in seconds for the chunked encode mode
+CHUNK_DURATION = int(os.getenv('VIDEO_CHUNK_DURATION', 120))
+
+# Number of candidate frames scored when picking a thumbnail
+THUMBNAIL_CANDIDATES = int(os.getenv('VIDEO_THUMBNAIL_CANDIDATES', 5))
+
+# Scrub-bar preview sprite sheets, tapped from the lowest rendition's scaled
+# stream: one tile every TRICKPLAY_INTERVAL seconds, COLUMNS x ROWS per sheet
+TRICKPLAY = os.getenv('VIDEO_TRICKPLAY', 'True') == 'True'
+TRICKPLAY_INTERVAL = int(os.getenv('VIDEO_TRICKPLAY_INTERVAL', 10))
+TRICKPLAY_WIDTH = int(os.getenv('VIDEO_TRICKPLAY_WIDTH', 160))
+TRICKPLAY_COLUMNS = 5
+TRICKPLAY_ROWS = 5
+
+# Encode progress is published to Redis for the status API, at most once
+# per VIDEO_PROGRESS_INTERVAL seconds per rendition
+PROGRESS_REDIS_URL = os.getenv('PROGRESS_REDIS_URL', CELERY_BROKER_URL)
+PROGRESS_INTERVAL = float(os.getenv('VIDEO_PROGRESS_INTERVAL', 1.0))
+
 # Initialize Celery
 app = Celery('tasks', broker=CELERY_BROKER_URL, backend=CELERY_RESULT_BACKEND)
 
@@ -54,20 +164,51 @@ app.conf.update(
     result_serializer='json',
     timezone='UTC',
     enable_utc=True,
+    # Encode tasks are long: take one at a time, and keep unacknowledged
+    # tasks invisible long enough that Redis does not redeliver them mid-encode
+    worker_prefetch_multiplier=1,
+    broker_transport_options={
+        'visibility_timeout': int(os.getenv('CELERY_VISIBILITY_TIMEOUT', 6 * 3600))
+    },
+    # Run by the celery_beat service
+    beat_schedule={
+        'cleanup-old-files': {
+            'task': 'tasks.cleanup_old_files',
+            'schedule': 3600.0,
+        },
+        'abort-stale-uploads': {
+            'task': 'tasks.abort_stale_uploads',
+            'schedule': 3600.0,
+        },
+    },
 )
 
 # Initialize database
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-# Initialize MinIO client
-minio_client = Minio(
+# Initialize MinIO client with a connection pool shared by all upload threads
+minio_client = create_minio_client(
     MINIO_ENDPOINT,
-    access_key=MINIO_ACCESS_KEY,
-    secret_key=MINIO_SECRET_KEY,
-    secure=MINIO_USE_SSL
+    MINIO_ACCESS_KEY,
+    MINIO_SECRET_KEY,
+    secure=MINIO_USE_SSL,
+    pool_size=MINIO_UPLOAD_WORKERS * 2
+)
+
+# Stats are reset at the start of each task, which is safe with the prefork
+# pool where a worker process runs one task at a time.
+bulk_uploader = BulkUploader(
+    minio_client,
+    MINIO_BUCKET_NAME,
+    workers=MINIO_UPLOAD_WORKERS,
+    retries=MINIO_UPLOAD_RETRIES,
+    part_size=MINIO_PART_SIZE_MB * 1024 * 1024
 )
 
+# Connections are only opened on first use
+redis_client = redis.Redis.from_url(PROGRESS_REDIS_URL)
+
 
 def get_db():
     """Get database session."""
@@ -78,168 +219,1206 @@ def get_db():
         db.close()
 
 
-def get_video_info(file_path):
-    """Get video information using ffprobe."""
-    cmd = [
-        'ffprobe',
-        '-v', 'error',
-        '-show_entries', 'format=duration',
-        '-of', 'default=noprint_wrappers=1:nokey=1',
-        file_path
-    ]
-    
+def progress_reporter(video_id):
+    """ProgressReporter publishing the status and encode progress of a video."""
+    return ProgressReporter(redis_client, video_id, interval=PROGRESS_INTERVAL)
+
+
+def file_sha256(file_path, block_size=1024 * 1024):
+    """SHA-256 of a file's content, read in blocks."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_object_source(source):
+    """
+    Whether a task's source is an object key in the bucket rather than a
+    local file; local sources are absolute paths.
+    """
+    return not os.path.isabs(source)
+
+
+def source_input(source):
+    """
+    Input FFmpeg and ffprobe read a source from: a local path as is, or a
+    presigned GET URL for an object. FFmpeg reads URLs with HTTP range
+    requests, so it seeks within the object instead of downloading it,
+    and no filesystem has to be shared with the API or other workers.
+    """
+    if not is_object_source(source):
+        return source
+    return minio_client.presigned_get_object(
+        MINIO_BUCKET_NAME, source, expires=timedelta(hours=SOURCE_URL_EXPIRATION_HOURS)
+    )
+
+
+def source_exists(source):
+    """Whether a source is still available."""
+    if not is_object_source(source):
+        return os.path.exists(source)
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        duration = float(result.stdout.strip())
-        return int(duration)
-    except Exception as e:
-        logger.error(f"Error getting video info: {e}")
-        return 0
+        minio_client.stat_object(MINIO_BUCKET_NAME, source)
+        return True
+    except S3Error:
+        return False
+
+
+def source_sha256(source, block_size=1024 * 1024):
+    """SHA-256 of a source's content, streamed from storage for objects."""
+    if not is_object_source(source):
+        return file_sha256(source, block_size)
+    digest = hashlib.sha256()
+    response = minio_client.get_object(MINIO_BUCKET_NAME, source)
+    try:
+        for block in response.stream(block_size):
+            digest.update(block)
+    finally:
+        response.close()
+        response.release_conn()
+    return digest.hexdigest()
+
+
+def remove_source(source):
+    """Delete a source once it is no longer needed; missing sources are ignored."""
+    if is_object_source(source):
+        with contextlib.suppress(S3Error):
+            minio_client.remove_object(MINIO_BUCKET_NAME, source)
+    elif os.path.exists(source):
+        os.remove(source)
 
 
-def encode_video_quality(input_path, output_dir, quality):
-    """Encode video to specific quality using FFmpeg."""
+def input_args(input_path):
+    """
+    FFmpeg input options for input_path. Reads over HTTP reconnect after a
+    dropped connection instead of failing the encode.
+    """
+    if input_path.startswith(('http://', 'https://')):
+        return ['-reconnect', '1', '-reconnect_on_network_error', '1', '-reconnect_delay_max', '10', '-i', input_path]
+    return ['-i', input_path]
+
+
+def fixed_rendition(quality):
+    """Build a rendition from the fixed QUALITY_LEVELS table."""
     config = QUALITY_LEVELS[quality]
+    width, height = (int(x) for x in config['resolution'].split('x'))
+    return {
+        'name': quality,
+        'width': width,
+        'height': height,
+        'bitrate': config['bitrate'],
+        'bufsize': config['bitrate'],
+        'crf': None,
+        'audio_bitrate': config['audio_bitrate'],
+    }
+
+
+def plan_ladder(source):
+    """Plan the renditions to encode for a probed source (MediaInfo)."""
+    if not ADAPTIVE_LADDER or not source:
+        return with_codec_levels([fixed_rendition(quality) for quality in QUALITY_LEVELS], source)
+    
+    src_width, src_height = source.width, source.height
+    short_side = min(src_width, src_height)
+    fps = source.fps or 30.0
+    source_bit_rate = source.video_bit_rate or source.bit_rate
+    
+    complexity = 1.0
+    if source_bit_rate:
+        bpp = source_bit_rate / (src_width * src_height * fps)
+        complexity = min(max(bpp / LADDER_REFERENCE_BPP, 0.6), 1.0)
+    fps_factor = 1.5 if fps > 30 else 1.0
+    
+    qualities = [
+        quality for quality in QUALITY_LEVELS
+        if fixed_rendition(quality)['height'] <= short_side
+    ] or [next(iter(QUALITY_LEVELS))]
+    
+    ladder = []
+    for quality in qualities:
+        rendition = fixed_rendition(quality)
+        scale = min(rendition['height'] / short_side, 1.0)
+        width = int(round(src_width * scale / 2)) * 2
+        height = int(round(src_height * scale / 2)) * 2
+        
+        maxrate = int(rendition['bitrate'].rstrip('k')) * fps_factor * complexity
+        if source_bit_rate:
+            maxrate = min(maxrate, source_bit_rate / 1000)
+        maxrate = int(maxrate)
+        
+        rendition.update({
+            'width': width,
+            'height': height,
+            'bitrate': f"{maxrate}k",
+            'bufsize': f"{maxrate * 2}k",
+            'crf': LADDER_CRF,
+        })
+        ladder.append(rendition)
+    
+    return with_codec_levels(ladder, source)
+
+
+def h264_level(width, height, fps, maxrate_kbps):
+    """Lowest H.264 level (e.g. '4.0') whose limits fit the rendition."""
+    frame_size = math.ceil(width / 16) * math.ceil(height / 16)
+    for level, max_rate, max_frame_size, max_bitrate in H264_LEVELS:
+        if frame_size <= max_frame_size and frame_size * fps <= max_rate and maxrate_kbps <= max_bitrate:
+            return level
+    return H264_LEVELS[-1][0]
+
+
+def with_codec_levels(ladder, source):
+    """Add the H.264 level and frame rate to every rendition of ladder."""
+    fps = (source.fps if source else 0) or 30.0
+    for rendition in ladder:
+        rendition['frame_rate'] = round(fps, 3)
+        rendition['level'] = h264_level(
+            rendition['width'], rendition['height'], fps, int(rendition['bitrate'].rstrip('k'))
+        )
+    return ladder
+
+
+def plan_audio(source, shared=AUDIO_GROUP):
+    """
+    Plan the shared audio renditions for a probed source (MediaInfo).
+    Returns [] when audio is muxed into every variant (not shared) or there
+    is no audio.
+    """
+    if not shared or not source.has_audio:
+        return []
+    return [{'name': f"audio_{bitrate}", 'bitrate': bitrate} for bitrate in AUDIO_BITRATES]
+
+
+def ladder_signature(ladder, segment_format='ts', audio=()):
+    """Fingerprint of every encode setting that affects the HLS output."""
+    settings = {'ladder': ladder, 'segment_duration': SEGMENT_DURATION}
+    if audio:
+        settings['audio'] = list(audio)
+    if FAST_START_SEGMENTS:
+        settings['fast_start_segments'] = FAST_START_SEGMENTS
+    if segment_format != 'ts':
+        settings['segment_format'] = segment_format
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+def segment_starts(fast_start=True):
+    """Start times of the leading segments; later ones follow every SEGMENT_DURATION."""
+    starts = [0.0]
+    for duration in (FAST_START_SEGMENTS if fast_start else []):
+        starts.append(starts[-1] + duration)
+    return starts
+
+
+def keyframe_args(index=None, fast_start=True):
+    """
+    FFmpeg arguments putting a keyframe exactly at every segment start and
+    nowhere else, so all renditions are cut at the same timestamps.
+    """
+    spec = f':v:{index}' if index is not None else ':v'
+    starts = segment_starts(fast_start)
+    
+    # n_forced counts the keyframes forced so far
+    expr = f"{starts[-1]}+(n_forced-{len(starts) - 1})*{SEGMENT_DURATION}"
+    for n in reversed(range(len(starts) - 1)):
+        expr = f"if(eq(n_forced,{n}),{starts[n]},{expr})"
+    
+    return [
+        f'-force_key_frames{spec}', f"expr:gte(t,{expr})",
+        # No scene-cut or GOP-limit keyframes between the forced ones
+        f'-sc_threshold{spec}', '0',
+        f'-g{spec}', str(SEGMENT_DURATION * 120),
+    ]
+
+
+def hls_time(fast_start=True):
+    """
+    Target segment duration for the HLS muxer. With fast start it is the
+    shortest scheduled segment: keyframes only occur at segment starts, so
+    the muxer still cuts exactly on the schedule.
+    """
+    if fast_start and FAST_START_SEGMENTS:
+        return str(min(FAST_START_SEGMENTS + [SEGMENT_DURATION]))
+    return str(SEGMENT_DURATION)
+
+
+def video_rate_args(rendition, index=None):
+    """FFmpeg rate control arguments for a rendition's video stream."""
+    spec = f':v:{index}' if index is not None else ':v'
+    if rendition['crf'] is None:
+        return [f'-b{spec}', rendition['bitrate']]
+    return [
+        f'-crf{spec}', str(rendition['crf']),
+        f'-maxrate{spec}', rendition['bitrate'],
+        f'-bufsize{spec}', rendition['bufsize'],
+    ]
+
+
+def codec_args(rendition, index=None):
+    """
+    FFmpeg arguments pinning the H.264 profile and level, so the stream
+    matches the CODECS attribute of the master playlist.
+    """
+    if not rendition.get('level'):
+        return []
+    spec = f':v:{index}' if index is not None else ':v'
+    return [
+        f'-profile{spec}', 'high',
+        f'-level{spec}', rendition['level'],
+        f'-pix_fmt{spec}', 'yuv420p',
+    ]
+
+
+def rendition_codecs(rendition, has_audio=False):
+    """
+    RFC 6381 CODECS value of a rendition: H.264 High profile at its level,
+    plus AAC-LC when audio is muxed in. Empty for renditions planned
+    without a level.
+    """
+    if not rendition.get('level'):
+        return ''
+    level = int(round(float(rendition['level']) * 10))
+    codecs = f"avc1.6400{level:02x}"
+    return f"{codecs},mp4a.40.2" if has_audio else codecs
+
+
+def plan_chunks(keyframes, duration, chunk_duration=CHUNK_DURATION):
+    """
+    Split the timeline into chunks of roughly chunk_duration seconds.
+    
+    Every chunk starts on a keyframe. Returns a list of (start, length)
+    tuples; the last chunk has a length of None and runs to the end.
+    """
+    starts = [0.0]
+    for keyframe in keyframes:
+        if keyframe - starts[-1] >= chunk_duration and duration - keyframe >= chunk_duration / 2:
+            starts.append(keyframe)
+    
+    chunks = []
+    for i, start in enumerate(starts):
+        length = starts[i + 1] - start if i + 1 < len(starts) else None
+        chunks.append((start, length))
+    return chunks
+
+
+def read_playlist_segments(playlist_path):
+    """Return the (duration, uri) entries of an HLS media playlist."""
+    segments = []
+    duration = None
+    with open(playlist_path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('#EXTINF:'):
+                duration = float(line[len('#EXTINF:'):].split(',')[0])
+            elif line and not line.startswith('#') and duration is not None:
+                segments.append((duration, line))
+                duration = None
+    return segments
+
+
+def write_media_playlist(playlist_path, segments):
+    """Write an HLS VOD media playlist from (duration, uri) entries."""
+    target_duration = int(math.ceil(max((d for d, _ in segments), default=SEGMENT_DURATION)))
+    
+    lines = [
+        '#EXTM3U',
+        '#EXT-X-VERSION:3',
+        f'#EXT-X-TARGETDURATION:{target_duration}',
+        '#EXT-X-MEDIA-SEQUENCE:0',
+        '#EXT-X-PLAYLIST-TYPE:VOD',
+    ]
+    for duration, uri in segments:
+        lines.append(f'#EXTINF:{duration:.6f},')
+        lines.append(uri)
+    lines.append('#EXT-X-ENDLIST')
+    
+    os.makedirs(os.path.dirname(playlist_path), exist_ok=True)
+    with open(playlist_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    
+    return playlist_path
+
+
+def measure_playlist(playlist_path, sizes=None, codecs=''):
+    """
+    Measure a rendition's size, average and peak bitrate (bits/s) and codecs
+    from its media playlist; sizes holds the sizes of streamed segments.
+    """
+    playlist_dir = os.path.dirname(playlist_path)
+    sizes = sizes or {}
+    total_bytes, total_duration, peak = 0, 0.0, 0
+    duration, length = None, None
+    
+    with open(playlist_path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('#EXTINF:'):
+                duration = float(line[len('#EXTINF:'):].split(',')[0])
+            elif line.startswith('#EXT-X-BYTERANGE:'):
+                length = int(line.split(':', 1)[1].partition('@')[0])
+            elif line.startswith('#EXT-X-MAP:'):
+                # Init section is fetched once per rendition
+                byterange = re.search(r'BYTERANGE="(\d+)', line)
+                if byterange:
+                    total_bytes += int(byterange.group(1))
+            elif line and not line.startswith('#') and duration is not None:
+                if length is None:
+                    local_path = os.path.join(playlist_dir, line)
+                    length = sizes.get(local_path) or (
+                        os.path.getsize(local_path) if os.path.exists(local_path) else 0
+                    )
+                total_bytes += length
+                total_duration += duration
+                if duration > 0:
+                    peak = max(peak, int(length * 8 / duration))
+                duration, length = None, None
+    
+    return {
+        'bytes': total_bytes,
+        'duration': round(total_duration, 3),
+        'average_bitrate': int(total_bytes * 8 / total_duration) if total_duration else 0,
+        'peak_bitrate': peak,
+        'codecs': codecs,
+    }
+
+
+def merge_measurements(parts):
+    """Combine the measure_playlist results of consecutive chunks of a rendition."""
+    total_bytes = sum(part['bytes'] for part in parts)
+    total_duration = sum(part['duration'] for part in parts)
+    return {
+        'bytes': total_bytes,
+        'duration': round(total_duration, 3),
+        'average_bitrate': int(total_bytes * 8 / total_duration) if total_duration else 0,
+        'peak_bitrate': max((part['peak_bitrate'] for part in parts), default=0),
+        'codecs': parts[0]['codecs'] if parts else '',
+    }
+
+
+def hls_segment_args(segment_dir, segment_format='ts', segment_name='segment_%03d.ts'):
+    """HLS muxer arguments writing a rendition's segments to segment_dir."""
+    if segment_format == 'fmp4':
+        # One file per rendition holding the init section and every fragment
+        return [
+            '-hls_segment_type', 'fmp4',
+            '-hls_flags', 'single_file',
+            '-hls_segment_filename', os.path.join(segment_dir, 'stream.m4s'),
+        ]
+    return [
+        '-hls_flags', 'temp_file',
+        '-hls_segment_filename', os.path.join(segment_dir, segment_name),
+    ]
+
+
+def audio_output_args(output_dir, audio, segment_format='ts', segment_name='segment_%03d.ts', start=None):
+    """
+    FFmpeg outputs writing each shared audio rendition as its own audio-only
+    HLS playlist. Audio has no keyframes to align, so these keep the
+    regular segment duration even when video uses fast start. start offsets
+    the output timestamps like the video output of a chunk encode.
+    """
+    args = []
+    for track in audio:
+        track_dir = os.path.join(output_dir, track['name'])
+        # Clear segments left by an earlier failed encode
+        shutil.rmtree(track_dir, ignore_errors=True)
+        os.makedirs(track_dir)
+        args += [
+            '-map', '0:a:0',
+            '-c:a', 'aac',
+            '-b:a', track['bitrate'],
+            *(['-output_ts_offset', f"{start:.3f}"] if start else []),
+            '-hls_time', str(SEGMENT_DURATION),
+            '-hls_list_size', '0',
+            *hls_segment_args(track_dir, segment_format, segment_name),
+            '-f', 'hls',
+            os.path.join(track_dir, 'playlist.m3u8')
+        ]
+    return args
+
+
+def trickplay_size(rendition):
+    """Size of one trickplay tile, keeping the rendition's aspect ratio."""
+    height = int(round(TRICKPLAY_WIDTH * rendition['height'] / rendition['width'] / 2)) * 2
+    return TRICKPLAY_WIDTH, height
+
+
+def trickplay_filter(source, rendition):
+    """Filter chain turning the rendition's scaled stream into [tp] sprite sheets."""
+    width, height = trickplay_size(rendition)
+    return (
+        f"{source}fps=1/{TRICKPLAY_INTERVAL},scale={width}:{height},"
+        f"tile={TRICKPLAY_COLUMNS}x{TRICKPLAY_ROWS}[tp]"
+    )
+
+
+def trickplay_output_args(trickplay_dir):
+    """FFmpeg output arguments writing the [tp] sprite sheets to trickplay_dir."""
+    # Clear sheets left by an earlier failed encode
+    shutil.rmtree(trickplay_dir, ignore_errors=True)
+    os.makedirs(trickplay_dir)
+    return ['-map', '[tp]', '-q:v', '5', '-f', 'image2', os.path.join(trickplay_dir, 'sprite_%03d.jpg')]
+
+
+def format_vtt_time(seconds):
+    """Format seconds as a WebVTT timestamp (HH:MM:SS.mmm)."""
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    return f"{hours:02d}:{minutes:02d}:{millis // 1000:02d}.{millis % 1000:03d}"
+
+
+def write_trickplay_vtt(trickplay_dir, rendition, duration):
+    """
+    Write thumbnails.vtt mapping each TRICKPLAY_INTERVAL of the video to
+    its tile in the sprite sheets, using media fragments (#xywh=).
+    Returns the track path, or None if no sheets were written.
+    """
+    sheets = sorted(f for f in os.listdir(trickplay_dir) if f.endswith('.jpg'))
+    per_sheet = TRICKPLAY_COLUMNS * TRICKPLAY_ROWS
+    count = min(int(math.ceil(duration / TRICKPLAY_INTERVAL)), len(sheets) * per_sheet)
+    if count <= 0:
+        return None
+    
+    width, height = trickplay_size(rendition)
+    lines = ['WEBVTT', '']
+    for i in range(count):
+        start = i * TRICKPLAY_INTERVAL
+        end = min(start + TRICKPLAY_INTERVAL, duration)
+        tile = i % per_sheet
+        x = (tile % TRICKPLAY_COLUMNS) * width
+        y = (tile // TRICKPLAY_COLUMNS) * height
+        lines.append(f"{format_vtt_time(start)} --> {format_vtt_time(end)}")
+        lines.append(f"{sheets[i // per_sheet]}#xywh={x},{y},{width},{height}")
+        lines.append('')
+    
+    track_path = os.path.join(trickplay_dir, 'thumbnails.vtt')
+    with open(track_path, 'w') as f:
+        f.write('\n'.join(lines))
+    return track_path
+
+
+def encode_video_quality(input_path, output_dir, rendition, trickplay_dir=None, segment_format='ts',
+                         audio_group=False, audio=(), progress=None):
+    """
+    Encode video to a specific rendition using FFmpeg, optionally with the
+    trickplay sprites and the shared audio renditions.
+    """
+    quality = rendition['name']
     output_path = os.path.join(output_dir, quality)
     os.makedirs(output_path, exist_ok=True)
     
     playlist_file = os.path.join(output_path, 'playlist.m3u8')
     
+    scale = f"scale={rendition['width']}:{rendition['height']}"
+    video_args = ['-map', '0:v:0', '-vf', scale]
+    trickplay_args = []
+    if trickplay_dir:
+        video_args = [
+            '-filter_complex', f"[0:v]{scale},split=2[vout][tpin];" + trickplay_filter('[tpin]', rendition),
+            '-map', '[vout]'
+        ]
+        trickplay_args = trickplay_output_args(trickplay_dir)
+    
+    audio_args = []
+    if not audio_group:
+        audio_args = ['-map', '0:a:0?', '-c:a', 'aac', '-b:a', rendition['audio_bitrate']]
+    
     cmd = [
-        'ffmpeg',
-        '-i', input_path,
-        '-vf', f"scale={config['resolution']}",
+        'ffmpeg', '-y',
+        *input_args(input_path),
+        *video_args,
         '-c:v', 'libx264',
-        '-b:v', config['bitrate'],
-        '-c:a', 'aac',
-        '-b:a', config['audio_bitrate'],
-        '-hls_time', str(SEGMENT_DURATION),
+        *video_rate_args(rendition),
+        *codec_args(rendition),
+        *keyframe_args(),
+        *audio_args,
+        '-hls_time', hls_time(),
         '-hls_list_size', '0',
-        '-hls_segment_filename', os.path.join(output_path, 'segment_%03d.ts'),
+        *hls_segment_args(output_path, segment_format),
         '-f', 'hls',
-        playlist_file
+        playlist_file,
+        *audio_output_args(output_dir, audio, segment_format),
+        *trickplay_args
     ]
     
     try:
-        subprocess.run(cmd, check=True, capture_output=True)
+        run_ffmpeg(cmd, progress)
         return playlist_file
     except subprocess.CalledProcessError as e:
-        logger.error(f"Error encoding {quality}: {e.stderr.decode()}")
+        logger.error(f"Error encoding {quality}: {redact_urls(e.stderr.decode())}")
         return None
 
 
-def create_master_playlist(output_dir, qualities):
-    """Create HLS master playlist."""
-    master_playlist = "#EXTM3U\n#EXT-X-VERSION:3\n\n"
+def encode_video_single_pass(input_path, output_dir, renditions, has_audio=True,
+                             start=None, duration=None, segment_name='segment_%03d.ts',
+                             trickplay_dir=None, segment_format='ts', audio_group=False, audio=(),
+                             progress=None):
+    """
+    Encode all renditions from a single decode of the source, optionally only
+    the start/duration part of it. Returns the video renditions that were written.
+    """
+    for rendition in renditions:
+        os.makedirs(os.path.join(output_dir, rendition['name']), exist_ok=True)
     
-    bitrate_map = {
-        '360p': 800000,
-        '480p': 1400000,
-        '720p': 2800000,
-        '1080p': 5000000,
-    }
+    split_outputs = ''.join(f"[v{i}]" for i in range(len(renditions)))
+    filters = [f"[0:v]split={len(renditions)}{split_outputs}"]
+    for i, rendition in enumerate(renditions):
+        filters.append(f"[v{i}]scale={rendition['width']}:{rendition['height']}[v{i}out]")
+    if trickplay_dir:
+        filters[1] = filters[1].replace('[v0out]', ',split=2[v0out][tpin]')
+        filters.append(trickplay_filter('[tpin]', renditions[0]))
     
-    for quality in qualities:
-        config = QUALITY_LEVELS[quality]
-        resolution = config['resolution']
-        bitrate = bitrate_map.get(quality, 800000)
+    cmd = ['ffmpeg', '-y']
+    if start is not None:
+        cmd += ['-ss', f"{start:.3f}"]
+    if duration is not None:
+        cmd += ['-t', f"{duration:.3f}"]
+    cmd += [*input_args(input_path), '-filter_complex', ';'.join(filters)]
+    if start:
+        cmd += ['-output_ts_offset', f"{start:.3f}"]
+    
+    stream_map = []
+    for i, rendition in enumerate(renditions):
+        cmd += [
+            '-map', f"[v{i}out]", f'-c:v:{i}', 'libx264',
+            *video_rate_args(rendition, i),
+            *codec_args(rendition, i),
+            *keyframe_args(i, fast_start=not start)
+        ]
+        if has_audio and not audio_group:
+            cmd += ['-map', '0:a:0', f'-c:a:{i}', 'aac', f'-b:a:{i}', rendition['audio_bitrate']]
+            stream_map.append(f"v:{i},a:{i},name:{rendition['name']}")
+        else:
+            stream_map.append(f"v:{i},name:{rendition['name']}")
+    
+    cmd += [
+        '-var_stream_map', ' '.join(stream_map),
+        '-hls_time', hls_time(fast_start=not start),
+        '-hls_list_size', '0',
+        *hls_segment_args(os.path.join(output_dir, '%v'), segment_format, segment_name),
+        '-f', 'hls',
+        os.path.join(output_dir, '%v', 'playlist.m3u8'),
+        *audio_output_args(output_dir, audio, segment_format, segment_name, start)
+    ]
+    if trickplay_dir:
+        cmd += trickplay_output_args(trickplay_dir)
+    
+    try:
+        run_ffmpeg(cmd, progress)
+        return [
+            rendition for rendition in renditions
+            if os.path.exists(os.path.join(output_dir, rendition['name'], 'playlist.m3u8'))
+        ]
+    except subprocess.CalledProcessError as e:
+        logger.error(f"Error in single-pass encode: {redact_urls(e.stderr.decode())}")
+        return []
+
+
+def create_master_playlist(output_dir, renditions, audio=(), stats=None):
+    """Create HLS master playlist, using measured bitrates from stats where available."""
+    stats = stats or {}
+    master_playlist = f"#EXTM3U\n#EXT-X-VERSION:{4 if audio else 3}\n\n"
+    
+    for i, track in enumerate(audio):
+        master_playlist += (
+            f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="{AUDIO_GROUP_ID}",NAME="{track["bitrate"]}",'
+            f'DEFAULT={"YES" if i == 0 else "NO"},AUTOSELECT=YES,URI="{track["name"]}/playlist.m3u8"\n'
+        )
+    if audio:
+        master_playlist += "\n"
+    
+    # Players may pick any rendition of the group, so assume the largest
+    audio_peak = audio_average = 0
+    audio_codecs = 'mp4a.40.2' if audio else ''
+    for track in audio:
+        nominal = int(track['bitrate'].rstrip('k')) * 1000
+        measured = stats.get(track['name']) or {}
+        audio_peak = max(audio_peak, measured.get('peak_bitrate') or nominal)
+        audio_average = max(audio_average, measured.get('average_bitrate') or nominal)
+    
+    for rendition in renditions:
+        measured = stats.get(rendition['name'])
+        if measured and measured['peak_bitrate']:
+            # Measured variants already include any muxed audio
+            bandwidth = measured['peak_bitrate'] + audio_peak
+            attributes = [
+                f"BANDWIDTH={bandwidth}",
+                f"AVERAGE-BANDWIDTH={measured['average_bitrate'] + audio_average}",
+            ]
+            codecs = ','.join(c for c in (measured['codecs'], audio_codecs) if c)
+            if codecs:
+                attributes.append(f'CODECS="{codecs}"')
+        else:
+            audio_bitrate = audio_peak if audio else int(rendition['audio_bitrate'].rstrip('k')) * 1000
+            attributes = [f"BANDWIDTH={int(rendition['bitrate'].rstrip('k')) * 1000 + audio_bitrate}"]
+        
+        attributes.append(f"RESOLUTION={rendition['width']}x{rendition['height']}")
+        if rendition.get('frame_rate'):
+            attributes.append(f"FRAME-RATE={rendition['frame_rate']:.3f}")
+        if audio:
+            attributes.append(f'AUDIO="{AUDIO_GROUP_ID}"')
         
-        master_playlist += f"#EXT-X-STREAM-INF:BANDWIDTH={bitrate},RESOLUTION={resolution}\n"
-        master_playlist += f"{quality}/playlist.m3u8\n\n"
+        master_playlist += f"#EXT-X-STREAM-INF:{','.join(attributes)}\n"
+        master_playlist += f"{rendition['name']}/playlist.m3u8\n\n"
     
+    # Write to a temporary file first so readers never see a partial playlist
     master_path = os.path.join(output_dir, 'master.m3u8')
-    with open(master_path, 'w') as f:
+    with open(f"{master_path}.tmp", 'w') as f:
         f.write(master_playlist)
+    os.replace(f"{master_path}.tmp", master_path)
     
     return master_path
 
 
-def upload_to_minio(local_dir, video_id):
-    """Upload processed video files to MinIO."""
+def upload_to_minio(local_dir, video_id, subdir=None):
+    """Upload processed video files (or only subdir) to MinIO."""
     try:
-        # Ensure bucket exists
-        if not minio_client.bucket_exists(MINIO_BUCKET_NAME):
-            minio_client.make_bucket(MINIO_BUCKET_NAME)
-        
-        uploaded_files = []
-        
-        # Upload all files in directory
-        for root, dirs, files in os.walk(local_dir):
-            for file in files:
-                local_path = os.path.join(root, file)
-                relative_path = os.path.relpath(local_path, local_dir)
-                object_name = f"videos/{video_id}/{relative_path}"
-                
-                # Determine content type
-                content_type = 'application/x-mpegURL' if file.endswith('.m3u8') else 'video/MP2T'
-                
-                minio_client.fput_object(
-                    MINIO_BUCKET_NAME,
-                    object_name,
-                    local_path,
-                    content_type=content_type
-                )
-                
-                uploaded_files.append(object_name)
-                logger.info(f"Uploaded: {object_name}")
-        
+        uploaded_files = bulk_uploader.upload_directory(local_dir, f"videos/{video_id}", subdir=subdir)
+        logger.info(f"Uploaded {len(uploaded_files)} files for video {video_id}")
         return uploaded_files
     
-    except S3Error as e:
+    except Exception as e:
         logger.error(f"MinIO upload error: {e}")
         return []
 
 
-def generate_thumbnail(input_path, video_id):
-    """Generate video thumbnail."""
-    thumbnail_path = f"/tmp/videos/thumbnail_{video_id}.jpg"
+def stream_segments(output_dir, video_id):
+    """
+    Context manager that streams segments written to output_dir to MinIO
+    while it is active. Yields the SegmentUploader, or None when streaming
+    uploads are disabled.
+    """
+    if not STREAMING_UPLOAD:
+        return contextlib.nullcontext()
     
-    # Get video duration first
-    duration = get_video_info(input_path)
+    return SegmentUploader(
+        output_dir,
+        f"videos/{video_id}",
+        bulk_uploader.upload_file,
+        workers=MINIO_UPLOAD_WORKERS
+    )
+
+
+def thumbnail_times(duration, count=THUMBNAIL_CANDIDATES):
+    """
+    Candidate thumbnail timestamps spread over the first half of the video,
+    starting at 10% of the duration (but at least 2 seconds in).
+    """
+    if duration <= 2:
+        return [0.0]
     
-    # Use 10% of duration or 2 seconds, whichever is smaller
-    thumb_time = min(max(duration * 0.1, 2), duration - 1) if duration > 2 else 1
+    first = min(max(duration * 0.1, 2), duration - 1)
+    last = max(min(duration * 0.5, duration - 1), first)
+    if count <= 1:
+        return [first]
+    step = (last - first) / (count - 1)
+    return sorted({round(first + i * step, 3) for i in range(count)})
+
+
+def generate_thumbnail(input_path, video_id, duration):
+    """Generate video thumbnail from the most detailed of several candidate keyframes."""
+    thumbnail_dir = f"/tmp/videos/thumbnail_{video_id}"
+    os.makedirs(thumbnail_dir, exist_ok=True)
+    times = thumbnail_times(duration)
     
-    cmd = [
-        'ffmpeg',
-        '-i', input_path,
-        '-ss', str(thumb_time),
-        '-vframes', '1',
-        '-vf', 'scale=1280:720',
-        '-q:v', '2',  # High quality
-        thumbnail_path
-    ]
+    cmd = ['ffmpeg', '-y']
+    for thumb_time in times:
+        cmd += ['-noaccurate_seek', '-ss', f"{thumb_time:.3f}", *input_args(input_path)]
+    for i in range(len(times)):
+        cmd += [
+            '-map', f'{i}:v:0',
+            '-frames:v', '1',
+            '-vf', 'scale=1280:720',
+            '-q:v', '2',  # High quality
+            os.path.join(thumbnail_dir, f'candidate_{i}.jpg')
+        ]
     
     try:
-        result = subprocess.run(cmd, check=True, capture_output=True, stderr=subprocess.PIPE)
+        subprocess.run(cmd, check=True, capture_output=True)
+        
+        candidates = []
+        for i, thumb_time in enumerate(times):
+            path = os.path.join(thumbnail_dir, f'candidate_{i}.jpg')
+            if os.path.exists(path):
+                candidates.append((os.path.getsize(path), thumb_time, path))
+        if not candidates:
+            raise Exception("FFmpeg produced no thumbnail candidates")
+        
+        _, thumb_time, thumbnail_path = max(candidates)
         logger.info(f"Thumbnail generated for video {video_id} at {thumb_time}s")
         
         # Upload thumbnail to MinIO
         object_name = f"thumbnails/{video_id}.jpg"
-        minio_client.fput_object(
-            MINIO_BUCKET_NAME,
-            object_name,
-            thumbnail_path,
-            content_type='image/jpeg'
-        )
+        bulk_uploader.upload_file(object_name, thumbnail_path, content_type='image/jpeg')
         
         logger.info(f"Thumbnail uploaded to MinIO: {object_name}")
         
-        # Clean up local thumbnail
-        os.remove(thumbnail_path)
-        
         return object_name
     
     except subprocess.CalledProcessError as e:
-        logger.error(f"FFmpeg error generating thumbnail: {e.stderr.decode()}")
+        logger.error(f"FFmpeg error generating thumbnail: {redact_urls(e.stderr.decode())}")
+        return None
+    except Exception as e:
+        logger.error(f"Error generating thumbnail: {redact_urls(e)}")
+        return None
+    
+    finally:
+        # Clean up local thumbnails
+        shutil.rmtree(thumbnail_dir, ignore_errors=True)
+
+
+def ensure_thumbnail(task, db, video_id, job, input_path, duration):
+    """
+    Return the video's checkpointed thumbnail, generating it if needed. Only
+    a generated thumbnail is checkpointed, so a retry tries again.
+    """
+    thumbnail_url = (job.stages or {}).get('thumbnail')
+    if thumbnail_url:
+        return thumbnail_url
+    
+    logger.info("Generating thumbnail...")
+    task.update_state(state='PROGRESS', meta={'stage': 'thumbnail'})
+    progress_reporter(video_id).set_stage('thumbnail')
+    thumbnail_url = generate_thumbnail(input_path, video_id, duration)
+    if thumbnail_url:
+        complete_stage(db, video_id, 'thumbnail', thumbnail_url)
+    return thumbnail_url
+
+
+def upsert_video_file(db, video_id, quality, **values):
+    """Insert or update the VideoFile record of a rendition."""
+    values['playlist_url'] = f"videos/{video_id}/{quality}/playlist.m3u8"
+    stmt = pg_insert(VideoFile).values(video_id=video_id, quality=quality, **values)
+    db.execute(stmt.on_conflict_do_update(index_elements=['video_id', 'quality'], set_=values))
+
+
+def record_rendition(db, video_id, rendition, stats=None):
+    """Create or update the VideoFile record of a rendition, with its measured stats if given."""
+    if stats:
+        upsert_video_file(
+            db, video_id, rendition['name'],
+            file_size=stats['bytes'],
+            bitrate=stats['average_bitrate'] // 1000,
+            peak_bitrate=stats['peak_bitrate'] // 1000,
+            codecs=stats['codecs'] or None
+        )
+        return
+    
+    db.execute(
+        pg_insert(VideoFile)
+        .values(
+            video_id=video_id,
+            quality=rendition['name'],
+            playlist_url=f"videos/{video_id}/{rendition['name']}/playlist.m3u8",
+            bitrate=int(rendition['bitrate'].rstrip('k'))
+        )
+        .on_conflict_do_nothing(index_elements=['video_id', 'quality'])
+    )
+
+
+def recorded_stats(db, video_id):
+    """
+    Measurements of a video's published renditions for the master playlist:
+    measured VideoFile records plus the shared audio measurements stored
+    with the job's 'audio' stage, keyed by rendition name.
+    """
+    stats = {
+        row.quality: {
+            'bytes': row.file_size,
+            'average_bitrate': row.bitrate * 1000,
+            'peak_bitrate': row.peak_bitrate * 1000,
+            'codecs': row.codecs or '',
+        }
+        for row in db.query(VideoFile).filter(VideoFile.video_id == video_id)
+        if row.peak_bitrate
+    }
+    
+    job = db.query(ProcessingJob).filter(ProcessingJob.video_id == video_id).first()
+    audio_stats = (job.stages or {}).get('audio') if job else None
+    if isinstance(audio_stats, dict):
+        stats.update(audio_stats)
+    return stats
+
+
+def load_job(db, video_id):
+    """Get the processing job of a video, creating it on the first run."""
+    now = datetime.utcnow()
+    db.execute(
+        pg_insert(ProcessingJob)
+        .values(video_id=video_id, stages={}, attempts=0, created_at=now, updated_at=now)
+        .on_conflict_do_nothing(index_elements=['video_id'])
+    )
+    db.commit()
+    return db.query(ProcessingJob).filter(ProcessingJob.video_id == video_id).first()
+
+
+def load_media(job):
+    """The MediaInfo recorded by the job's probe stage."""
+    return MediaInfo.from_dict(job.stages['probe']['media'])
+
+
+def stage_done(job, stage):
+    """Check whether a pipeline stage was checkpointed."""
+    return job is not None and stage in (job.stages or {})
+
+
+def complete_stage(db, video_id, stage, result=True):
+    """
+    Checkpoint a pipeline stage with its JSON-serializable result.
+    
+    The job row is locked while its stages are merged, since rendition and
+    chunk tasks of the same video checkpoint concurrently.
+    """
+    job = db.query(ProcessingJob).filter(
+        ProcessingJob.video_id == video_id
+    ).populate_existing().with_for_update().first()
+    if not job:
+        db.rollback()
         return None
+    
+    job.stages = {**(job.stages or {}), stage: result}
+    job.updated_at = datetime.utcnow()
+    db.commit()
+    return job
+
+
+def mark_video_ready(db, video, renditions, thumbnail_url=None, signature=None):
+    """
+    Publish the processed video and record its renditions.
+    
+    signature should only be given when the whole planned ladder was
+    encoded, since it marks the output as reusable for identical uploads.
+    """
+    video.status = 'ready'
+    video.hls_master_url = f"videos/{video.id}/master.m3u8"
+    if thumbnail_url:
+        video.thumbnail = thumbnail_url
+    if not video.published_at:
+        video.published_at = datetime.utcnow()
+    if signature:
+        video.encode_signature = signature
+    
+    # Create video file records
+    for rendition in renditions:
+        record_rendition(db, video.id, rendition)
+    
+    db.commit()
+    progress_reporter(video.id).set_status('ready', stage='done')
+
+
+def publish_rendition(db, video_id, output_dir, rendition, ladder, audio=(), stats=None):
+    """
+    Upload and record a finished rendition and rebuild the master playlist, so it
+    is playable before the rest of the ladder is done.
+    """
+    quality = rendition['name']
+    if not upload_to_minio(output_dir, video_id, subdir=quality):
+        logger.error(f"Failed to upload {quality} for video {video_id}")
+        return False
+    
+    try:
+        video = db.query(Video).filter(Video.id == video_id).with_for_update().first()
+        if not video:
+            db.rollback()
+            return False
+        
+        record_rendition(db, video_id, rendition, stats)
+        
+        if audio:
+            job = db.query(ProcessingJob).filter(
+                ProcessingJob.video_id == video_id
+            ).populate_existing().first()
+            if not stage_done(job, 'audio'):
+                db.commit()
+                logger.info(f"{quality} of video {video_id} is waiting for its audio")
+                return True
+        
+        published = {row.quality for row in db.query(VideoFile.quality).filter(VideoFile.video_id == video_id)}
+        master_path = create_master_playlist(
+            output_dir, [r for r in ladder if r['name'] in published], audio, recorded_stats(db, video_id)
+        )
+        minio_client.fput_object(
+            MINIO_BUCKET_NAME,
+            f"videos/{video_id}/master.m3u8",
+            master_path,
+            content_type='application/x-mpegURL'
+        )
+        
+        if video.status != 'ready':
+            video.status = 'ready'
+            video.hls_master_url = f"videos/{video_id}/master.m3u8"
+            video.published_at = datetime.utcnow()
+            logger.info(f"Video {video_id} is playable with {quality}")
+        
+        db.commit()
+        progress_reporter(video_id).set_status('ready')
+        return True
+    
     except Exception as e:
-        logger.error(f"Error generating thumbnail: {e}")
+        db.rollback()
+        logger.error(f"Error publishing {quality} for video {video_id}: {e}")
+        return False
+
+
+def publish_audio(db, video_id, output_dir, audio, sizes=None):
+    """
+    Upload the shared audio renditions and checkpoint them with their
+    measurements. Raises on failure, since the video-only variants are
+    unplayable without them. sizes are the streamed segment sizes.
+    """
+    stats = {
+        track['name']: measure_playlist(
+            os.path.join(output_dir, track['name'], 'playlist.m3u8'), sizes, 'mp4a.40.2'
+        )
+        for track in audio
+    }
+    for track in audio:
+        if not upload_to_minio(output_dir, video_id, subdir=track['name']):
+            raise Exception(f"Failed to upload {track['name']} for video {video_id}")
+    
+    for track in audio:
+        shutil.rmtree(os.path.join(output_dir, track['name']), ignore_errors=True)
+    complete_stage(db, video_id, 'audio', stats)
+    logger.info(f"Audio of video {video_id} published: {', '.join(t['name'] for t in audio)}")
+
+
+def publish_trickplay(db, video_id, output_dir, rendition, duration):
+    """
+    Index the sprite sheets in output_dir/trickplay with a WebVTT track,
+    upload them and record the track on the video. Failures only cost the
+    previews, so they are logged instead of raised.
+    """
+    trickplay_dir = os.path.join(output_dir, 'trickplay')
+    track_url = f"videos/{video_id}/trickplay/thumbnails.vtt"
+    
+    try:
+        if not write_trickplay_vtt(trickplay_dir, rendition, duration):
+            logger.warning(f"No trickplay sprites were written for video {video_id}")
+            return None
+        if not upload_to_minio(output_dir, video_id, subdir='trickplay'):
+            return None
+        
+        db.query(Video).filter(Video.id == video_id).update({'trickplay_url': track_url})
+        complete_stage(db, video_id, 'trickplay', track_url)
+        logger.info(f"Trickplay track published for video {video_id}")
+        return track_url
+    
+    except Exception as e:
+        logger.error(f"Error publishing trickplay for video {video_id}: {e}")
+        db.rollback()
+        return None
+    
+    finally:
+        shutil.rmtree(trickplay_dir, ignore_errors=True)
+
+
+def find_encoded_duplicate(db, video, signature):
+    """Find a ready video with the same source content and encode settings."""
+    if not video.source_hash:
         return None
+    
+    return db.query(Video).filter(
+        Video.source_hash == video.source_hash,
+        Video.encode_signature == signature,
+        Video.status == 'ready',
+        Video.id != video.id
+    ).order_by(Video.id).first()
+
+
+def reuse_encoded_video(db, video, original):
+    """
+    Publish a video by server-side copying the HLS output of an identical,
+    already encoded upload instead of encoding it again.
+    """
+    copied = bulk_uploader.copy_prefix(f"videos/{original.id}", f"videos/{video.id}")
+    if not copied:
+        raise Exception(f"No encoded objects found for video {original.id}")
+    
+    for original_file in db.query(VideoFile).filter(VideoFile.video_id == original.id).all():
+        upsert_video_file(
+            db, video.id, original_file.quality,
+            file_size=original_file.file_size,
+            bitrate=original_file.bitrate,
+            peak_bitrate=original_file.peak_bitrate,
+            codecs=original_file.codecs
+        )
+    
+    video.status = 'ready'
+    video.hls_master_url = f"videos/{video.id}/master.m3u8"
+    video.encode_signature = original.encode_signature
+    video.duration = original.duration
+    if original.trickplay_url:
+        video.trickplay_url = original.trickplay_url.replace(f"videos/{original.id}/", f"videos/{video.id}/", 1)
+    # Thumbnails are never overwritten, so the original one can be shared
+    if not video.thumbnail:
+        video.thumbnail = original.thumbnail
+    video.published_at = datetime.utcnow()
+    db.commit()
+    progress_reporter(video.id).set_status('ready', stage='done')
+    
+    return copied
 
 
-@app.task(name='tasks.process_video', bind=True)
-def process_video(self, video_id, input_file_path):
+def mark_video_failed(db, video_id):
+    """
+    Set video status to failed, ignoring database errors; a partially published
+    video stays ready. Always publishes a final progress event.
+    """
+    published = False
+    try:
+        db.rollback()
+        video = db.query(Video).filter(Video.id == video_id).first()
+        published = video is not None and video.status == 'ready'
+        if video and not published:
+            video.status = 'failed'
+            db.commit()
+    except:
+        pass
+    
+    if published:
+        progress_reporter(video_id).set_status('ready', stage='done', partial=True)
+    else:
+        progress_reporter(video_id).set_status('failed')
+
+
+def encode_ladder(task, db, job, video_id, input_file_path, output_dir, media, ladder, segment_format='ts',
+                  audio=()):
+    """
+    Encode the ladder into output_dir, publishing and checkpointing each
+    rendition, and return the encoded renditions.
+    """
+    encoded = [rendition for rendition in ladder if stage_done(job, f"rendition:{rendition['name']}")]
+    remaining = [rendition for rendition in ladder if rendition not in encoded]
+    if encoded:
+        logger.info(f"Resuming video {video_id}, already encoded: {', '.join(r['name'] for r in encoded)}")
+    
+    trickplay_dir = os.path.join(output_dir, 'trickplay')
+    trickplay_rendition = ladder[0] if TRICKPLAY and not stage_done(job, 'trickplay') else None
+    
+    # Shared audio still to encode; cleared once it is published
+    pending_audio = [] if stage_done(job, 'audio') else list(audio)
+    audio_args = {'audio_group': bool(audio)}
+    
+    reporter = progress_reporter(video_id)
+    reporter.set_stage('encode')
+    
+    def trickplay_for(rendition):
+        return trickplay_dir if rendition is trickplay_rendition else None
+    
+    # Renditions not checkpointed may have partial output from a crashed
+    # attempt; clear it before the segment uploader starts watching
+    for rendition in remaining:
+        shutil.rmtree(os.path.join(output_dir, rendition['name']), ignore_errors=True)
+    
+    def clear_output(rendition):
+        # Output of a failed encode, before the rendition is encoded again
+        if uploader:
+            uploader.flush()
+        for name in [rendition['name'], *(track['name'] for track in pending_audio)]:
+            shutil.rmtree(os.path.join(output_dir, name), ignore_errors=True)
+            if uploader:
+                uploader.forget(os.path.join(output_dir, name))
+    
+    def progress_for(renditions):
+        return reporter.tracker([r['name'] for r in renditions], media.duration, media.fps)
+    
+    def finish(rendition):
+        quality = rendition['name']
+        encoded.append(rendition)
+        if uploader:
+            uploader.flush()
+        sizes = uploader.sizes if uploader else None
+        if pending_audio:
+            publish_audio(db, video_id, output_dir, pending_audio, sizes)
+            pending_audio.clear()
+        if rendition is trickplay_rendition:
+            publish_trickplay(db, video_id, output_dir, rendition, media.duration)
+        
+        stats = measure_playlist(
+            os.path.join(output_dir, quality, 'playlist.m3u8'), sizes,
+            rendition_codecs(rendition, media.has_audio and not audio)
+        )
+        if PROGRESSIVE_PUBLISH:
+            uploaded = publish_rendition(db, video_id, output_dir, rendition, ladder, audio, stats)
+        else:
+            record_rendition(db, video_id, rendition, stats)
+            db.commit()
+            uploaded = bool(upload_to_minio(output_dir, video_id, subdir=quality))
+        
+        # Otherwise the files stay in output_dir for the final upload
+        if uploaded:
+            shutil.rmtree(os.path.join(output_dir, quality), ignore_errors=True)
+            complete_stage(db, video_id, f"rendition:{quality}")
+    
+    with stream_segments(output_dir, video_id) as uploader:
+        if ENCODE_MODE in ('single_pass', 'chunked') and remaining:
+            if PROGRESSIVE_PUBLISH and PROGRESSIVE_FIRST_RENDITION and len(remaining) > 1 and not encoded:
+                # Get the lowest rendition out first, then encode the rest together
+                first = remaining.pop(0)
+                logger.info(f"Encoding {first['name']} for early publishing...")
+                task.update_state(state='PROGRESS', meta={'stage': 'encode', 'qualities': [first['name']]})
+                
+                if encode_video_quality(input_file_path, output_dir, first, trickplay_for(first), segment_format,
+                                        audio=pending_audio, progress=progress_for([first]), **audio_args):
+                    finish(first)
+                else:
+                    clear_output(first)
+                    remaining.insert(0, first)
+            
+            logger.info(f"Encoding {', '.join(r['name'] for r in remaining)} in a single pass...")
+            task.update_state(state='PROGRESS', meta={'stage': 'encode', 'qualities': [r['name'] for r in remaining]})
+            
+            single_pass = encode_video_single_pass(
+                input_file_path, output_dir, remaining,
+                has_audio=media.has_audio,
+                trickplay_dir=trickplay_for(remaining[0]),
+                segment_format=segment_format,
+                audio=pending_audio,
+                progress=progress_for(remaining),
+                **audio_args
+            )
+            if single_pass:
+                logger.info(f"Successfully encoded {', '.join(r['name'] for r in single_pass)}")
+                for rendition in single_pass:
+                    finish(rendition)
+                # Renditions the single pass did not write are encoded one by one
+                remaining = [rendition for rendition in remaining if rendition not in single_pass]
+                if remaining:
+                    logger.warning(
+                        f"Single pass did not produce {', '.join(r['name'] for r in remaining)}, "
+                        f"encoding them per quality"
+                    )
+            else:
+                logger.warning("Single-pass encode failed, falling back to per-quality encoding")
+        
+        for rendition in remaining:
+            quality = rendition['name']
+            logger.info(f"Encoding {quality}...")
+            task.update_state(state='PROGRESS', meta={'stage': 'encode', 'qualities': [quality]})
+            
+            clear_output(rendition)
+            playlist = encode_video_quality(
+                input_file_path, output_dir, rendition, trickplay_for(rendition), segment_format,
+                audio=pending_audio, progress=progress_for([rendition]), **audio_args
+            )
+            if playlist:
+                logger.info(f"Successfully encoded {quality}")
+                finish(rendition)
+    
+    # Keep ladder order for the master playlist
+    return [rendition for rendition in ladder if rendition in encoded]
+
+
+@app.task(
+    name='tasks.process_video',
+    bind=True,
+    acks_late=True,
+    reject_on_worker_lost=True,
+    max_retries=PROCESS_MAX_RETRIES
+)
+def process_video(self, video_id, input_file_path, segment_format=None, source_object=None):
     """
     Main task to process uploaded video:
     1. Get video information
@@ -249,6 +1428,8 @@ def process_video(self, video_id, input_file_path):
     5. Update database
     """
     db = SessionLocal()
+    bulk_uploader.stats.reset()
+    source = source_object or input_file_path
     
     try:
         # Get video from database
@@ -257,70 +1438,163 @@ def process_video(self, video_id, input_file_path):
             logger.error(f"Video {video_id} not found in database")
             return {"status": "error", "message": "Video not found"}
         
-        logger.info(f"Processing video {video_id}: {video.title}")
+        job = load_job(db, video_id)
+        if stage_done(job, 'finalize'):
+            logger.info(f"Video {video_id} was already processed")
+            return {
+                "status": "success",
+                "video_id": video_id,
+                "master_playlist": video.hls_master_url
+            }
+        
+        job.attempts += 1
+        db.commit()
+        
+        # A worker killed mid-encode gets the task redelivered without a
+        # retry being counted, so give up on a source that keeps killing them
+        if job.attempts > self.max_retries + 1:
+            logger.error(f"Giving up on video {video_id} after {job.attempts - 1} attempts")
+            mark_video_failed(db, video_id)
+            remove_source(source)
+            return {"status": "error", "message": "Too many attempts"}
+        
+        progress_reporter(video_id).set_status(video.status, stage='probe', attempt=job.attempts)
+        
+        logger.info(f"Processing video {video_id}: {video.title} (attempt {job.attempts})")
         
-        # Get video duration
-        duration = get_video_info(input_file_path)
-        video.duration = duration
+        input_path = source_input(source)
+        
+        # Probe the source and plan the ladder once, so retries keep the same ladder
+        if not stage_done(job, 'probe'):
+            media = probe_media(input_path, keyframes=ENCODE_MODE == 'chunked')
+            segment_format = segment_format or SEGMENT_FORMAT
+            if segment_format not in SEGMENT_FORMATS or ENCODE_MODE == 'chunked':
+                segment_format = 'ts'
+            job = complete_stage(db, video_id, 'probe', {
+                'media': media.to_dict(),
+                'ladder': plan_ladder(media),
+                # Chunked audio would restart AAC priming at every chunk
+                'audio': plan_audio(media, shared=AUDIO_GROUP or ENCODE_MODE == 'chunked'),
+                'segment_format': segment_format
+            })
+        
+        media = load_media(job)
+        ladder = job.stages['probe']['ladder']
+        audio = job.stages['probe'].get('audio', [])
+        segment_format = job.stages['probe'].get('segment_format', 'ts')
+        # Uploads assembled from chunks are not hashed by the API
+        if not video.source_hash:
+            video.source_hash = source_sha256(source)
+        video.duration = int(media.duration)
         db.commit()
         
+        qualities = [rendition['name'] for rendition in ladder]
+        logger.info(f"Planned ladder for video {video_id}: {', '.join(qualities)}")
+        
+        # Skip the encode entirely if this exact source was already encoded
+        signature = ladder_signature(ladder, segment_format, audio)
+        original = find_encoded_duplicate(db, video, signature)
+        if original:
+            logger.info(f"Video {video_id} duplicates video {original.id}, reusing its encode")
+            reuse_encoded_video(db, video, original)
+            complete_stage(db, video_id, 'finalize')
+            remove_source(source)
+            
+            return {
+                "status": "success",
+                "video_id": video_id,
+                "reused_from": original.id,
+                "master_playlist": video.hls_master_url
+            }
+        
+        if ENCODE_MODE in ('chunked', 'distributed') and stage_done(job, 'dispatch'):
+            logger.info(f"Encode tasks for video {video_id} were already dispatched")
+            return {"status": "dispatched", "video_id": video_id}
+        
+        if ENCODE_MODE == 'chunked':
+            chunks = plan_chunks(media.keyframes or [], media.duration)
+            if len(chunks) > 1:
+                logger.info(f"Dispatching {len(chunks)} chunk tasks for video {video_id}")
+                result = chord(
+                    group(
+                        *(
+                            encode_chunk.s(video_id, source, index, start, length, ladder, audio)
+                            for index, (start, length) in enumerate(chunks)
+                        ),
+                        encode_shared_tracks.s(video_id, source, ladder, audio)
+                    ),
+                    finalize_chunked_video.s(video_id, source, ladder, audio)
+                ).apply_async()
+                complete_stage(db, video_id, 'dispatch', result.id)
+                
+                return {
+                    "status": "dispatched",
+                    "video_id": video_id,
+                    "chunks": len(chunks),
+                    "finalize_task_id": result.id
+                }
+            logger.info(f"Video {video_id} is too short to chunk, encoding in a single pass")
+        
+        if ENCODE_MODE == 'distributed':
+            logger.info(f"Dispatching {len(qualities)} rendition tasks for video {video_id}")
+            result = chord(
+                group(
+                    encode_rendition.s(video_id, source, rendition, ladder, segment_format, audio)
+                    for rendition in ladder
+                ),
+                finalize_video.s(video_id, source, ladder, segment_format, audio)
+            ).apply_async()
+            complete_stage(db, video_id, 'dispatch', result.id)
+            
+            return {
+                "status": "dispatched",
+                "video_id": video_id,
+                "qualities": qualities,
+                "finalize_task_id": result.id
+            }
+        
         # Create output directory
         output_dir = f"/tmp/videos/processed_{video_id}"
         os.makedirs(output_dir, exist_ok=True)
         
         # Encode to different qualities
-        encoded_qualities = []
-        for quality in ['360p', '480p', '720p', '1080p']:
-            logger.info(f"Encoding {quality}...")
-            self.update_state(state='PROGRESS', meta={'quality': quality, 'progress': 25})
-            
-            playlist = encode_video_quality(input_file_path, output_dir, quality)
-            if playlist:
-                encoded_qualities.append(quality)
-                logger.info(f"Successfully encoded {quality}")
+        encoded = encode_ladder(
+            self, db, job, video_id, input_path, output_dir, media, ladder, segment_format, audio
+        )
         
-        if not encoded_qualities:
+        if not encoded:
             raise Exception("Failed to encode any quality levels")
         
         # Create master playlist
         logger.info("Creating master playlist...")
-        master_playlist = create_master_playlist(output_dir, encoded_qualities)
+        if audio and not stage_done(load_job(db, video_id), 'audio'):
+            raise Exception("Failed to encode audio")
+        master_playlist = create_master_playlist(output_dir, encoded, audio, recorded_stats(db, video_id))
         
         # Generate thumbnail
-        logger.info("Generating thumbnail...")
-        self.update_state(state='PROGRESS', meta={'stage': 'thumbnail', 'progress': 75})
-        thumbnail_url = generate_thumbnail(input_file_path, video_id)
+        thumbnail_url = ensure_thumbnail(self, db, video_id, job, input_path, media.duration)
         
         # Upload to MinIO
-        logger.info("Uploading to storage...")
-        self.update_state(state='PROGRESS', meta={'stage': 'upload', 'progress': 85})
-        uploaded_files = upload_to_minio(output_dir, video_id)
-        
-        if not uploaded_files:
-            raise Exception("Failed to upload files to storage")
+        if not stage_done(job, 'upload'):
+            logger.info("Uploading to storage...")
+            self.update_state(state='PROGRESS', meta={'stage': 'upload'})
+            progress_reporter(video_id).set_stage('upload')
+            uploaded_files = upload_to_minio(output_dir, video_id)
+            
+            if not uploaded_files:
+                raise Exception("Failed to upload files to storage")
+            job = complete_stage(db, video_id, 'upload')
         
         # Update video in database
-        video.status = 'ready'
-        video.hls_master_url = f"videos/{video_id}/master.m3u8"
-        if thumbnail_url:
-            video.thumbnail = thumbnail_url
-        video.published_at = datetime.utcnow()
-        
-        # Create video file records
-        for quality in encoded_qualities:
-            video_file = VideoFile(
-                video_id=video_id,
-                quality=quality,
-                playlist_url=f"videos/{video_id}/{quality}/playlist.m3u8",
-                bitrate=int(QUALITY_LEVELS[quality]['bitrate'].replace('k', ''))
-            )
-            db.add(video_file)
-        
-        db.commit()
+        mark_video_ready(
+            db, video, encoded, thumbnail_url,
+            signature=signature if len(encoded) == len(ladder) else None
+        )
+        complete_stage(db, video_id, 'finalize')
         
         # Clean up temporary files
         logger.info("Cleaning up...")
-        os.remove(input_file_path)
+        remove_source(source)
         shutil.rmtree(output_dir, ignore_errors=True)
         
         logger.info(f"Video {video_id} processed successfully")
@@ -328,32 +1602,351 @@ def process_video(self, video_id, input_file_path):
         return {
             "status": "success",
             "video_id": video_id,
-            "qualities": encoded_qualities,
-            "master_playlist": video.hls_master_url
+            "qualities": [rendition['name'] for rendition in encoded],
+            "master_playlist": video.hls_master_url,
+            "upload": bulk_uploader.stats.as_dict()
         }
     
     except Exception as e:
-        logger.error(f"Error processing video {video_id}: {str(e)}")
+        logger.error(f"Error processing video {video_id}: {redact_urls(e)}")
+        db.rollback()
         
-        # Update video status to failed
+        # Keep the source and checkpoints so the retry resumes from here;
+        # a source ffprobe cannot read will not get better on retry
         try:
-            video = db.query(Video).filter(Video.id == video_id).first()
-            if video:
-                video.status = 'failed'
-                db.commit()
-        except:
-            pass
+            retryable = not isinstance(e, ProbeError) and source_exists(source)
+        except Exception as check_error:
+            logger.error(f"Could not check the source of video {video_id}: {check_error}")
+            retryable = False
+        if retryable and self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=PROCESS_RETRY_DELAY * (self.request.retries + 1))
+        
+        # Update video status to failed
+        mark_video_failed(db, video_id)
         
         # Clean up
-        if os.path.exists(input_file_path):
-            os.remove(input_file_path)
+        remove_source(source)
+        
+        return {"status": "error", "message": redact_urls(e)}
+    
+    finally:
+        db.close()
+
+
+@app.task(name='tasks.encode_rendition', bind=True, acks_late=True, reject_on_worker_lost=True)
+def encode_rendition(self, video_id, source, rendition, ladder, segment_format='ts', audio=()):
+    """
+    Encode and upload a single rendition of a distributed encode. Returns the
+    quality name, or None if the rendition failed.
+    """
+    quality = rendition['name']
+    output_dir = f"/tmp/videos/processed_{video_id}_{quality}"
+    # Clear output left by a crashed attempt, so it is not streamed
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+    db = SessionLocal()
+    
+    try:
+        job = load_job(db, video_id)
+        if stage_done(job, f"rendition:{quality}"):
+            logger.info(f"{quality} of video {video_id} was already encoded")
+            return quality
+        
+        lowest = quality == ladder[0]['name']
+        trickplay = TRICKPLAY and lowest and not stage_done(job, 'trickplay')
+        trickplay_dir = os.path.join(output_dir, 'trickplay') if trickplay else None
+        pending_audio = audio if lowest and not stage_done(job, 'audio') else []
+        media = load_media(job)
         
-        return {"status": "error", "message": str(e)}
+        logger.info(f"Encoding {quality} for video {video_id}...")
+        self.update_state(state='PROGRESS', meta={'video_id': video_id, 'quality': quality})
+        reporter = progress_reporter(video_id)
+        reporter.set_stage('encode')
+        
+        with stream_segments(output_dir, video_id) as uploader:
+            playlist = encode_video_quality(
+                source_input(source), output_dir, rendition, trickplay_dir, segment_format,
+                audio_group=bool(audio), audio=pending_audio,
+                progress=reporter.tracker([quality], media.duration, media.fps)
+            )
+        if not playlist:
+            return None
+        
+        sizes = uploader.sizes if uploader else None
+        if pending_audio:
+            publish_audio(db, video_id, output_dir, pending_audio, sizes)
+        if trickplay:
+            publish_trickplay(db, video_id, output_dir, rendition, media.duration)
+        
+        stats = measure_playlist(playlist, sizes, rendition_codecs(rendition, media.has_audio and not audio))
+        if PROGRESSIVE_PUBLISH:
+            if not publish_rendition(db, video_id, output_dir, rendition, ladder, audio, stats):
+                return None
+        elif upload_to_minio(output_dir, video_id):
+            record_rendition(db, video_id, rendition, stats)
+            db.commit()
+        else:
+            logger.error(f"Failed to upload {quality} for video {video_id}")
+            return None
+        
+        complete_stage(db, video_id, f"rendition:{quality}")
+        logger.info(f"Successfully encoded and uploaded {quality} for video {video_id}")
+        return quality
+    
+    except Exception as e:
+        # Never raise: a failing header task would keep the chord from finalizing
+        logger.error(f"Error encoding {quality} for video {video_id}: {redact_urls(e)}")
+        return None
     
     finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        db.close()
+
+
+def publish_encoded_video(task, video_id, source, output_dir, encoded, signature=None, audio=(),
+                          stats=None):
+    """
+    Finish a fanned-out encode whose segments are already in MinIO: write
+    and upload the master playlist (plus anything else in output_dir),
+    generate the thumbnail and publish the video. stats holds measurements
+    not recorded by the encode tasks themselves, keyed by rendition name.
+    """
+    db = SessionLocal()
+    bulk_uploader.stats.reset()
+    
+    try:
+        video = db.query(Video).filter(Video.id == video_id).first()
+        if not video:
+            logger.error(f"Video {video_id} not found in database")
+            return {"status": "error", "message": "Video not found"}
+        
+        job = load_job(db, video_id)
+        if stage_done(job, 'finalize'):
+            logger.info(f"Video {video_id} was already finalized")
+            return {
+                "status": "success",
+                "video_id": video_id,
+                "master_playlist": video.hls_master_url
+            }
+        
+        if not encoded:
+            raise Exception("Failed to encode any quality levels")
+        
+        os.makedirs(output_dir, exist_ok=True)
+        
+        stats = stats or {}
+        for rendition in encoded:
+            if rendition['name'] in stats:
+                record_rendition(db, video_id, rendition, stats[rendition['name']])
+        db.commit()
+        
+        logger.info("Creating master playlist...")
+        create_master_playlist(output_dir, encoded, audio, {**recorded_stats(db, video_id), **stats})
+        
+        thumbnail_url = ensure_thumbnail(task, db, video_id, job, source_input(source), load_media(job).duration)
+        
+        logger.info("Uploading playlists...")
+        task.update_state(state='PROGRESS', meta={'stage': 'upload'})
+        progress_reporter(video_id).set_stage('upload')
+        if not upload_to_minio(output_dir, video_id):
+            raise Exception("Failed to upload files to storage")
+        
+        mark_video_ready(db, video, encoded, thumbnail_url, signature=signature)
+        complete_stage(db, video_id, 'finalize')
+        
+        logger.info("Cleaning up...")
+        remove_source(source)
+        
+        logger.info(f"Video {video_id} processed successfully")
+        
+        return {
+            "status": "success",
+            "video_id": video_id,
+            "qualities": [rendition['name'] for rendition in encoded],
+            "master_playlist": video.hls_master_url,
+            "upload": bulk_uploader.stats.as_dict()
+        }
+    
+    except Exception as e:
+        logger.error(f"Error finalizing video {video_id}: {redact_urls(e)}")
+        
+        mark_video_failed(db, video_id)
+        
+        remove_source(source)
+        
+        return {"status": "error", "message": redact_urls(e)}
+    
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
         db.close()
 
 
+@app.task(name='tasks.finalize_video', bind=True)
+def finalize_video(self, results, video_id, source, ladder, segment_format='ts', audio=()):
+    """
+    Chord callback for a distributed encode: write and upload the master
+    playlist, generate the thumbnail and publish the video.
+    """
+    # Keep ladder order regardless of which renditions failed
+    encoded = [rendition for rendition in ladder if rendition['name'] in results]
+    output_dir = f"/tmp/videos/processed_{video_id}"
+    signature = ladder_signature(ladder, segment_format, audio) if len(encoded) == len(ladder) else None
+    
+    # Shared audio is encoded by the lowest rendition's task
+    if audio and ladder[0]['name'] not in results:
+        logger.error(f"Audio of video {video_id} failed to encode")
+        encoded = []
+    
+    return publish_encoded_video(self, video_id, source, output_dir, encoded, signature, audio)
+
+
+@app.task(name='tasks.encode_chunk', bind=True, acks_late=True, reject_on_worker_lost=True)
+def encode_chunk(self, video_id, source, chunk_index, start, length, ladder, audio=()):
+    """
+    Encode one keyframe-aligned chunk of the source to every quality. Returns its
+    segments and measurements per quality, or None if the chunk failed.
+    """
+    output_dir = f"/tmp/videos/processed_{video_id}_chunk_{chunk_index:03d}"
+    # Clear output left by a crashed attempt, so it is not streamed
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir)
+    db = SessionLocal()
+    
+    try:
+        job = load_job(db, video_id)
+        if stage_done(job, f"chunk:{chunk_index}"):
+            logger.info(f"Chunk {chunk_index} of video {video_id} was already encoded")
+            return job.stages[f"chunk:{chunk_index}"]
+        
+        logger.info(f"Encoding chunk {chunk_index} of video {video_id} from {start:.3f}s...")
+        self.update_state(state='PROGRESS', meta={'video_id': video_id, 'chunk': chunk_index})
+        
+        media = load_media(job)
+        has_audio = media.has_audio
+        reporter = progress_reporter(video_id)
+        reporter.set_stage('encode')
+        progress = reporter.tracker(
+            [f"chunk:{chunk_index:03d}"], length or max(media.duration - start, 0.0), media.fps
+        )
+        
+        with stream_segments(output_dir, video_id) as uploader:
+            encoded = encode_video_single_pass(
+                source_input(source), output_dir, ladder,
+                has_audio=has_audio,
+                start=start, duration=length,
+                segment_name=f"segment_{chunk_index:03d}_%03d.ts",
+                audio_group=bool(audio),
+                progress=progress
+            )
+        if not encoded:
+            return None
+        
+        # Chunk playlists are stitched by the finalizer, only upload segments
+        segments, stats = {}, {}
+        for rendition in encoded:
+            quality = rendition['name']
+            playlist_path = os.path.join(output_dir, quality, 'playlist.m3u8')
+            codecs = rendition_codecs(rendition, has_audio and not audio)
+            segments[quality] = read_playlist_segments(playlist_path)
+            stats[quality] = measure_playlist(playlist_path, uploader.sizes if uploader else None, codecs)
+            os.remove(playlist_path)
+        
+        # Segments may all have been streamed already
+        pending = any(files for _, _, files in os.walk(output_dir))
+        if pending and not upload_to_minio(output_dir, video_id):
+            logger.error(f"Failed to upload chunk {chunk_index} of video {video_id}")
+            return None
+        
+        result = {'segments': segments, 'stats': stats}
+        complete_stage(db, video_id, f"chunk:{chunk_index}", result)
+        return result
+    
+    except Exception as e:
+        # Never raise: a failing header task would keep the chord from finalizing
+        logger.error(f"Error encoding chunk {chunk_index} of video {video_id}: {redact_urls(e)}")
+        return None
+    
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        db.close()
+
+
+@app.task(name='tasks.encode_shared_tracks', bind=True, acks_late=True, reject_on_worker_lost=True)
+def encode_shared_tracks(self, video_id, source, ladder, audio=()):
+    """
+    Encode the shared audio and trickplay of a chunked encode over the whole
+    source. Returns False if the audio failed.
+    """
+    output_dir = f"/tmp/videos/processed_{video_id}_tracks"
+    db = SessionLocal()
+    
+    try:
+        job = load_job(db, video_id)
+        pending_audio = [] if stage_done(job, 'audio') else list(audio)
+        trickplay_rendition = ladder[0] if TRICKPLAY and not stage_done(job, 'trickplay') else None
+        if not pending_audio and not trickplay_rendition:
+            return True
+        
+        logger.info(f"Encoding audio and trickplay of video {video_id} over the whole source...")
+        self.update_state(state='PROGRESS', meta={'video_id': video_id, 'stage': 'tracks'})
+        media = load_media(job)
+        os.makedirs(output_dir, exist_ok=True)
+        trickplay_dir = os.path.join(output_dir, 'trickplay')
+        
+        cmd = ['ffmpeg', '-y', *input_args(source_input(source))]
+        if trickplay_rendition:
+            cmd += ['-filter_complex', trickplay_filter('[0:v]', trickplay_rendition)]
+        cmd += audio_output_args(output_dir, pending_audio)
+        if trickplay_rendition:
+            cmd += trickplay_output_args(trickplay_dir)
+        
+        run_ffmpeg(cmd, progress_reporter(video_id).tracker(['tracks'], media.duration))
+        
+        if pending_audio:
+            publish_audio(db, video_id, output_dir, pending_audio)
+        if trickplay_rendition:
+            publish_trickplay(db, video_id, output_dir, trickplay_rendition, media.duration)
+        return True
+    
+    except Exception as e:
+        # Never raise: a failing header task would keep the chord from finalizing
+        stderr = getattr(e, 'stderr', None)
+        logger.error(f"Error encoding audio and trickplay of video {video_id}: {redact_urls(stderr.decode() if stderr else e)}")
+        return False
+    
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        db.close()
+
+
+@app.task(name='tasks.finalize_chunked_video', bind=True)
+def finalize_chunked_video(self, results, video_id, source, ladder, audio=()):
+    """
+    Chord callback for a chunked encode: stitch the chunk playlists per quality,
+    then publish like finalize_video.
+    """
+    output_dir = f"/tmp/videos/processed_{video_id}"
+    *chunks, tracks_published = results
+    
+    encoded = []
+    stats = {}
+    if all(chunks) and tracks_published:
+        for rendition in ladder:
+            quality = rendition['name']
+            if not all(quality in chunk['segments'] for chunk in chunks):
+                continue
+            
+            segments = [tuple(entry) for chunk in chunks for entry in chunk['segments'][quality]]
+            write_media_playlist(os.path.join(output_dir, quality, 'playlist.m3u8'), segments)
+            stats[quality] = merge_measurements([chunk['stats'][quality] for chunk in chunks])
+            encoded.append(rendition)
+    else:
+        logger.error(f"Chunks of video {video_id} failed to encode")
+    
+    signature = ladder_signature(ladder, audio=audio) if len(encoded) == len(ladder) else None
+    return publish_encoded_video(self, video_id, source, output_dir, encoded, signature, audio, stats)
+
+
 @app.task(name='tasks.cleanup_old_files')
 def cleanup_old_files():
     """Periodic task to clean up old temporary files."""
@@ -370,3 +1963,29 @@ def cleanup_old_files():
                         logger.info(f"Deleted old file: {filename}")
             except Exception as e:
                 logger.error(f"Error deleting {filename}: {e}")
+
+
+@app.task(name='tasks.abort_stale_uploads')
+def abort_stale_uploads():
+    """Periodic task to abort abandoned multipart uploads of upload sources."""
+    # Minio has no public API for listing or aborting multipart uploads
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=DIRECT_UPLOAD_EXPIRATION_HOURS)
+    key_marker = upload_id_marker = None
+    while True:
+        result = minio_client._list_multipart_uploads(
+            MINIO_BUCKET_NAME,
+            prefix=SOURCE_PREFIX,
+            key_marker=key_marker,
+            upload_id_marker=upload_id_marker
+        )
+        for upload in result.uploads:
+            if upload.initiated_time and upload.initiated_time < cutoff:
+                try:
+                    minio_client._abort_multipart_upload(MINIO_BUCKET_NAME, upload.object_name, upload.upload_id)
+                    logger.info(f"Aborted stale upload of {upload.object_name}")
+                except S3Error as e:
+                    logger.error(f"Error aborting upload of {upload.object_name}: {e}")
+        
+        if not result.is_truncated:
+            break
+        key_marker, upload_id_marker = result.next_key_marker, result.next_upload_id_marker
@@ -0,0 +1,317 @@
+"""
+Object storage upload helpers for Celery workers.
+"""
+import os
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import urllib3
+from minio import Minio
+from minio.commonconfig import CopySource
+from minio.error import S3Error
+
+logger = logging.getLogger(__name__)
+
+# Errors worth retrying; anything else (e.g. a missing local file) fails fast
+RETRYABLE_ERRORS = (S3Error, urllib3.exceptions.HTTPError, ConnectionError, TimeoutError)
+
+
+def create_minio_client(endpoint, access_key, secret_key, secure=False, pool_size=10):
+    """
+    Create a MinIO client backed by a shared keep-alive connection pool
+    large enough for pool_size concurrent uploads.
+    """
+    http_client = urllib3.PoolManager(
+        num_pools=4,
+        maxsize=pool_size,
+        block=True,
+        timeout=urllib3.Timeout(connect=10, read=300),
+        retries=False,
+    )
+    return Minio(
+        endpoint,
+        access_key=access_key,
+        secret_key=secret_key,
+        secure=secure,
+        http_client=http_client
+    )
+
+
+def content_type_for(file_name):
+    """Content type for files produced by the encode pipeline."""
+    if file_name.endswith('.m3u8'):
+        return 'application/x-mpegURL'
+    if file_name.endswith('.jpg'):
+        return 'image/jpeg'
+    if file_name.endswith('.vtt'):
+        return 'text/vtt'
+    if file_name.endswith(('.m4s', '.mp4')):
+        return 'video/mp4'
+    return 'video/MP2T'
+
+
+class UploadStats:
+    """Thread-safe throughput counters for a batch of uploads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.objects = 0
+            self.bytes = 0
+            self.retries = 0
+            self.failures = 0
+            self.started = None
+            self.finished = None
+
+    def record(self, size, started, finished, retries=0, failed=False):
+        with self._lock:
+            if failed:
+                self.failures += 1
+            else:
+                self.objects += 1
+                self.bytes += size
+            self.retries += retries
+            self.started = started if self.started is None else min(self.started, started)
+            self.finished = finished if self.finished is None else max(self.finished, finished)
+
+    def as_dict(self):
+        with self._lock:
+            seconds = (self.finished - self.started) if self.started is not None else 0.0
+            return {
+                'objects': self.objects,
+                'bytes': self.bytes,
+                'retries': self.retries,
+                'failures': self.failures,
+                'seconds': round(seconds, 3),
+                'throughput_mbps': round(self.bytes * 8 / 1e6 / seconds, 2) if seconds else 0.0,
+            }
+
+
+class BulkUploader:
+    """
+    Concurrent uploader for many objects into one bucket.
+
+    Objects are uploaded from a thread pool over the client's shared
+    connection pool, each with retries and exponential backoff. Files larger
+    than part_size are sent as multipart uploads. Stats accumulate in
+    self.stats until reset.
+    """
+
+    def __init__(self, client, bucket, workers=8, retries=3, backoff=0.5, part_size=16 * 1024 * 1024):
+        self.client = client
+        self.bucket = bucket
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.part_size = part_size
+        self.stats = UploadStats()
+        self._bucket_ready = False
+
+    def ensure_bucket(self):
+        """Create the bucket if needed, checking only once per process."""
+        if self._bucket_ready:
+            return
+        if not self.client.bucket_exists(self.bucket):
+            self.client.make_bucket(self.bucket)
+        self._bucket_ready = True
+
+    def upload_file(self, object_name, local_path, content_type=None):
+        """Upload one file, retrying transient errors with backoff."""
+        self.ensure_bucket()
+        size = os.path.getsize(local_path)
+        started = time.monotonic()
+
+        for attempt in range(self.retries + 1):
+            try:
+                self.client.fput_object(
+                    self.bucket,
+                    object_name,
+                    local_path,
+                    content_type=content_type or content_type_for(local_path),
+                    part_size=self.part_size
+                )
+                self.stats.record(size, started, time.monotonic(), retries=attempt)
+                return object_name
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.retries:
+                    self.stats.record(size, started, time.monotonic(), retries=attempt, failed=True)
+                    raise
+                delay = self.backoff * (2 ** attempt)
+                logger.warning(f"Upload of {object_name} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def upload_directory(self, local_dir, object_prefix, subdir=None):
+        """
+        Upload every file under local_dir (or only local_dir/subdir) with
+        object names relative to local_dir. Playlists are uploaded after all
+        other files so they never reference a missing segment.
+
+        Returns the uploaded object names; raises the first upload error
+        after the remaining uploads have finished.
+        """
+        walk_dir = os.path.join(local_dir, subdir) if subdir else local_dir
+        media, playlists = [], []
+        for root, dirs, files in os.walk(walk_dir):
+            for file in files:
+                local_path = os.path.join(root, file)
+                object_name = f"{object_prefix}/{os.path.relpath(local_path, local_dir)}"
+                (playlists if file.endswith('.m3u8') else media).append((object_name, local_path))
+
+        uploaded = []
+        for batch in (media, playlists):
+            if not batch:
+                continue
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bulk-upload') as executor:
+                futures = [executor.submit(self.upload_file, name, path) for name, path in batch]
+            # Executor has waited for every upload; surface the first error
+            for future in futures:
+                uploaded.append(future.result())
+
+        return uploaded
+
+    def copy_object(self, source_name, object_name):
+        """Server-side copy of one object within the bucket, with retries."""
+        for attempt in range(self.retries + 1):
+            try:
+                self.client.copy_object(self.bucket, object_name, CopySource(self.bucket, source_name))
+                return object_name
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * (2 ** attempt)
+                logger.warning(f"Copy of {source_name} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def copy_prefix(self, source_prefix, target_prefix):
+        """
+        Server-side copy every object under source_prefix to target_prefix.
+        No object data passes through the worker. Returns the new object names.
+        """
+        source_names = [
+            obj.object_name
+            for obj in self.client.list_objects(self.bucket, prefix=f"{source_prefix}/", recursive=True)
+        ]
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bulk-copy') as executor:
+            futures = [
+                executor.submit(self.copy_object, name, f"{target_prefix}/{name[len(source_prefix) + 1:]}")
+                for name in source_names
+            ]
+        return [future.result() for future in futures]
+
+
+class SegmentUploader:
+    """
+    Upload HLS segments to object storage while FFmpeg is still encoding.
+
+    FFmpeg must be run with `-hls_flags temp_file`, so a segment only appears
+    under its final `.ts` name once it is complete. A background thread
+    polls the output directory and hands every new segment to a bounded
+    thread pool, which uploads it and deletes the local copy. Playlists are
+    left on disk for the caller to upload last, after FFmpeg has exited.
+    Segments that fail to upload are kept locally so a later directory
+    upload picks them up again. The size of every segment is kept in
+    self.sizes (local path -> bytes) for measuring the rendition afterwards.
+
+    Usage:
+        with SegmentUploader(output_dir, f"videos/{video_id}", upload_file):
+            run_ffmpeg(...)
+    """
+
+    def __init__(self, local_dir, object_prefix, upload_file, workers=4, poll_interval=0.5):
+        self.local_dir = local_dir
+        self.object_prefix = object_prefix
+        self.upload_file = upload_file
+        self.poll_interval = poll_interval
+
+        self.uploaded = []
+        self.failed = []
+        self.sizes = {}
+
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='segment-upload')
+        self._futures = []
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def start(self):
+        """Start watching the output directory."""
+        self._thread.start()
+
+    def stop(self):
+        """Upload any remaining segments and wait for all uploads to finish."""
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+        logger.info(
+            f"Streamed {len(self.uploaded)} segments to {self.object_prefix}"
+            + (f", {len(self.failed)} failed" if self.failed else "")
+        )
+        return self.uploaded
+
+    def flush(self):
+        """Upload every segment that is complete now and wait for the uploads."""
+        self._scan()
+        for future in list(self._futures):
+            future.result()
+
+    def forget(self, directory):
+        """
+        Drop the segments seen under directory, so segments an encode writes
+        there again are uploaded and measured anew. Call flush() first.
+        """
+        prefix = os.path.join(directory, '')
+        with self._scan_lock:
+            self._seen = {path for path in self._seen if not path.startswith(prefix)}
+            self.sizes = {path: size for path, size in self.sizes.items() if not path.startswith(prefix)}
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            self._scan()
+
+    def _scan(self):
+        # Called from both the watcher thread and flush()
+        with self._scan_lock:
+            for root, dirs, files in os.walk(self.local_dir):
+                for file in files:
+                    if not file.endswith('.ts'):
+                        continue
+
+                    local_path = os.path.join(root, file)
+                    if local_path in self._seen:
+                        continue
+
+                    self._seen.add(local_path)
+                    self.sizes[local_path] = os.path.getsize(local_path)
+                    self._futures.append(self._executor.submit(self._upload, local_path))
+
+    def _upload(self, local_path):
+        relative_path = os.path.relpath(local_path, self.local_dir)
+        object_name = f"{self.object_prefix}/{relative_path}"
+
+        try:
+            self.upload_file(object_name, local_path)
+            os.remove(local_path)
+            with self._lock:
+                self.uploaded.append(object_name)
+        except Exception as e:
+            logger.error(f"Error streaming segment {object_name}: {e}")
+            with self._lock:
+                self.failed.append(local_path)